@@ -2,26 +2,47 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from jwt import InvalidTokenError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 
-from app.sql_app import crud, schemas
-from app.sql_app.database import SessionLocal
+from app.cache import LRUCache
+from app.setting import settings
+from app.sql_app import async_crud, crud, schemas
+from app.sql_app.database import AsyncReadSessionLocal, AsyncSessionLocal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# 已认证用户的缓存，键为令牌中的用户名。只在当前进程内有效，
+# 多个 worker 之间依靠较短的缓存时间保证用户被停用后及时失效
+user_cache = LRUCache(
+    maxsize=settings.user_cache_maxsize if settings.user_cache_ttl_seconds > 0 else 0,
+    ttl=settings.user_cache_ttl_seconds,
+)
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+def invalidate_user_cache(*names):
+    """用户被修改或停用后清除缓存，不传用户名时清空全部缓存"""
+    if not names:
+        user_cache.clear()
+    for name in names:
+        user_cache.pop(name)
+
+
+async def get_db():
+    """写会话，使用唯一的写连接"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db():
+    """只读会话，使用只读连接池"""
+    async with AsyncReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)
 ):
     try:
         payload = jwt.decode(token, crud.SECRET_KEY, algorithms=[crud.ALGORITHM])
@@ -39,14 +60,19 @@ async def get_current_user(
             detail="无法验证凭据",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = crud.authenticate_user(db, name=token_data.username)
-    if not user["status"]:
+    user = user_cache.get(token_data.username)
+    if user is not None:
+        return user
+    result = await async_crud.authenticate_user(db, name=token_data.username)
+    if not result["status"]:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=user["message"],
+            detail=result["message"],
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return user["user"]
+    user = schemas.CurrentUser.model_validate(result["user"])
+    user_cache.set(token_data.username, user)
+    return user
 
 
 async def get_current_active_user(
@@ -0,0 +1,125 @@
+"""
+账单批量导入导出的文件格式处理
+
+导入时逐行读取上传的 CSV 或 NDJSON 文件，产出 (行号, 原始数据) 元组，
+某一行无法解析时产出的原始数据为异常对象，由调用方记录到错误报告中。
+导出时把一批账单编码为同样格式的文本，导出的文件可以直接再次导入。
+两个方向都只持有当前行或当前批次，内存占用与文件大小无关。
+"""
+import csv
+import io
+import json
+import os
+
+CSV_FORMAT = "csv"
+NDJSON_FORMAT = "ndjson"
+
+# 导入导出使用的列
+BILL_COLUMNS = ["bill_date", "summary", "amount", "handle"]
+# 导出文件的 Content-Type
+MEDIA_TYPES = {
+    CSV_FORMAT: "text/csv; charset=utf-8",
+    NDJSON_FORMAT: "application/x-ndjson",
+}
+
+# 文件扩展名与格式的对应关系
+FORMAT_EXTENSIONS = {
+    ".csv": CSV_FORMAT,
+    ".ndjson": NDJSON_FORMAT,
+    ".jsonl": NDJSON_FORMAT,
+}
+
+
+def detect_format(filename: str, content_type: str = None):
+    """根据文件名或 Content-Type 判断文件格式，无法判断时返回 None"""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in FORMAT_EXTENSIONS:
+        return FORMAT_EXTENSIONS[extension]
+    if content_type in ("text/csv", "application/csv"):
+        return CSV_FORMAT
+    if content_type in ("application/x-ndjson", "application/jsonl"):
+        return NDJSON_FORMAT
+    return None
+
+
+def iter_csv_rows(binary_file):
+    """
+    逐行解析带表头的 CSV 文件
+
+    无法按 UTF-8 解码的字节替换为 U+FFFD 后继续读取，所在行作为错误行报告，
+    不影响后续行的解析和行号。
+    """
+    text_file = io.TextIOWrapper(binary_file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        reader = csv.DictReader(text_file)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield reader.line_num, ValueError(f"CSV格式错误: {e}")
+                continue
+            if None in row:
+                yield reader.line_num, ValueError("列数多于表头")
+                continue
+            if any("\ufffd" in value for value in row.values() if value):
+                yield reader.line_num, ValueError("编码错误: 不是有效的 UTF-8 文本")
+                continue
+            yield reader.line_num, row
+    finally:
+        # 上传文件由调用方关闭，这里只解除包装
+        text_file.detach()
+
+
+def iter_ndjson_rows(binary_file):
+    """逐行解析 NDJSON 文件，每行一个 JSON 对象，空行会被跳过"""
+    for line_num, line in enumerate(binary_file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_num, ValueError(f"JSON格式错误: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line_num, ValueError("每行必须是一个JSON对象")
+            continue
+        yield line_num, row
+
+
+def iter_rows(binary_file, file_format: str):
+    if file_format == CSV_FORMAT:
+        return iter_csv_rows(binary_file)
+    if file_format == NDJSON_FORMAT:
+        return iter_ndjson_rows(binary_file)
+    raise ValueError(f"不支持的文件格式: {file_format}")
+
+
+def _bill_values(row):
+    """把 (id, bill_date, summary, amount, handle) 转换为导出的列值"""
+    _, bill_date, summary, amount, handle = row
+    return [bill_date.strftime("%Y-%m-%d %H:%M:%S"), summary, amount, bool(handle)]
+
+
+def csv_header():
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(BILL_COLUMNS)
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def encode_csv_rows(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        values = _bill_values(row)
+        values[3] = "true" if values[3] else "false"
+        writer.writerow(values)
+    return buffer.getvalue().encode("utf-8")
+
+
+def encode_ndjson_rows(rows):
+    return "".join(
+        json.dumps(dict(zip(BILL_COLUMNS, _bill_values(row))), ensure_ascii=False) + "\n"
+        for row in rows
+    ).encode("utf-8")
@@ -0,0 +1,138 @@
+"""
+docx 模板渲染
+
+模板文件只解析一次，每次渲染都在解析结果的独立副本上进行，渲染结果写入内存，
+多个请求可以同时渲染同一个模板而互不影响。
+
+TemplateRegistry 管理一个目录下的具名模板，解析结果按修改时间失效并有数量上限，
+新增或更新模板文件后无需重启，下一次使用时重新解析一次即可。
+"""
+import copy
+import io
+import json
+import threading
+import zipfile
+from pathlib import Path
+
+from docx import Document
+from docxcompose.composer import Composer
+from docxtpl import DocxTemplate
+
+from app.cache import LRUCache
+
+DOCX_MEDIA_TYPE = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+)
+
+
+class ParsedDocxTemplate:
+    """预先解析好的 docx 模板，第一次使用时才读取文件"""
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self.version = version  # 解析时文件的 (修改时间, 大小)
+        self._document = None
+        self._lock = threading.Lock()
+
+    def new_template(self) -> DocxTemplate:
+        """返回一个可以独立渲染的模板副本"""
+        with self._lock:
+            if self._document is None:
+                self._document = Document(self.path)
+            document = copy.deepcopy(self._document)
+        template = DocxTemplate(self.path)
+        template.docx = document
+        return template
+
+    def render(self, context: dict) -> bytes:
+        """渲染模板并返回 docx 文件内容"""
+        template = self.new_template()
+        template.render(context)
+        buffer = io.BytesIO()
+        template.save(buffer)
+        return buffer.getvalue()
+
+
+class TemplateRegistry:
+    """模板目录中的具名 docx 模板，名称为不含扩展名的文件名"""
+
+    def __init__(self, directory, maxsize: int = 16):
+        self.directory = Path(directory)
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def names(self):
+        """列出模板目录中的模板"""
+        if not self.directory.is_dir():
+            return []
+        templates = []
+        for path in sorted(self.directory.glob("*.docx")):
+            if path.name.startswith("~$"):  # Word 打开文件时产生的临时文件
+                continue
+            stat = path.stat()
+            templates.append(
+                {"name": path.stem, "size": stat.st_size, "modified": stat.st_mtime}
+            )
+        return templates
+
+    def path_of(self, name: str) -> Path:
+        """返回模板文件路径，模板不存在时抛出 KeyError"""
+        if not name or name.startswith(".") or "/" in name or "\\" in name:
+            raise KeyError(name)
+        path = self.directory / f"{name}.docx"
+        if not path.is_file():
+            raise KeyError(name)
+        return path
+
+    def get(self, name: str) -> ParsedDocxTemplate:
+        """按名称获取模板，模板不存在时抛出 KeyError"""
+        return self.load(self.path_of(name))
+
+    def load(self, path) -> ParsedDocxTemplate:
+        """获取任意路径的模板，文件修改后会重新解析"""
+        stat = Path(path).stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = str(path)
+        template = self._cache.get(key)
+        if template is not None and template.version == version:
+            return template
+        with self._lock:
+            # 等待锁期间其他线程可能已经解析过了
+            template = self._cache.get(key)
+            if template is None or template.version != version:
+                template = ParsedDocxTemplate(path, version)
+                template.new_template()  # 在这里完成解析，之后的渲染只需复制
+                self._cache.set(key, template)
+        return template
+
+
+# 进程池中的每个工作进程各自缓存已解析的模板
+_worker_registry = TemplateRegistry(directory=".")
+
+
+def render_in_worker(path: str, context: dict) -> bytes:
+    """在工作进程中渲染模板，同一进程内每个模板只解析一次"""
+    return _worker_registry.load(path).render(context)
+
+
+def merge_documents(contents: list) -> bytes:
+    """用 docxcompose 把多个 docx 合并为一个，每个文档从新的一页开始"""
+    master = Document(io.BytesIO(contents[0]))
+    composer = Composer(master)
+    for content in contents[1:]:
+        master.add_page_break()
+        composer.append(Document(io.BytesIO(content)))
+    buffer = io.BytesIO()
+    composer.save(buffer)
+    return buffer.getvalue()
+
+
+def zip_documents(contents: dict, errors: list = None) -> bytes:
+    """把 {文件名: 内容} 打包为 zip，有失败项时附带 errors.json"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for name, content in contents.items():
+            zipf.writestr(name, content)
+        if errors:
+            zipf.writestr("errors.json", json.dumps(errors, ensure_ascii=False, indent=2))
+    return buffer.getvalue()
@@ -0,0 +1,53 @@
+"""
+会议表格解析
+
+从会议安排的 HTML 表格中提取每一行的时间、会议名称和链接，再按模板生成文本。
+模板在设置时编译一次，{time}、{name}、{url} 为占位符，{{ 和 }} 表示花括号本身，
+不支持其他表达式。
+"""
+import string
+
+import lxml.html
+
+MEETING_FIELDS = ("time", "name", "url")
+
+
+class MeetingTemplate:
+    def __init__(self, template: str):
+        parts = []
+        try:
+            parsed = list(string.Formatter().parse(template))
+        except ValueError as e:
+            raise ValueError(f"模板格式错误: {e}")
+        for literal, field, spec, conversion in parsed:
+            parts.append(literal.replace("%", "%%"))
+            if field is None:
+                continue
+            if field not in MEETING_FIELDS or spec or conversion:
+                raise ValueError(f"不支持的占位符: {{{field}}}，可用的占位符为 {MEETING_FIELDS}")
+            parts.append(f"%({field})s")
+        self.template = template
+        # 编译为 % 格式化字符串，格式化时不再解析模板
+        self._format = "".join(parts)
+
+    def format(self, **values) -> str:
+        return self._format % values
+
+
+def _cell_text(cell):
+    return cell.text_content().replace(" ", "").replace("\n", "")
+
+
+def parse_rows(data: str):
+    """逐行产出表格中的 {time, name, url}，没有表格时抛出 ValueError"""
+    root = lxml.html.fromstring(data)
+    table = root if root.tag == "table" else next(root.iter("table"), None)
+    if table is None:
+        raise ValueError("没有找到表格")
+    for row in table.iter("tr"):
+        cells = list(row.iter("td"))
+        time = _cell_text(cells[0]).replace(":", "：").split("-")[0] if cells else ""
+        name = _cell_text(cells[1]).split("【")[0] if len(cells) > 1 else ""
+        link = next(cells[2].iter("a"), None) if len(cells) > 2 else None
+        url = link.get("href") if link is not None else ""
+        yield {"time": time, "name": name, "url": url}
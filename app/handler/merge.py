@@ -0,0 +1,195 @@
+"""
+文件合并后端
+
+PDF 和 DOCX 在本进程（的进程池）中直接合并，合并函数登记在 LOCAL_MERGERS 中，
+按扩展名选择；其他格式（如 PPTX）或混合格式由外部的合并服务完成：上传的文件先分块
+写入服务器上的临时目录，再把文件路径列表发给合并服务，合并服务把结果写到指定的输出路径。
+
+RemoteMergeBackend 使用一个共享的 httpx.AsyncClient，连接复用并限制最大连接数，
+连接失败时自动重试。create_stub_app 提供一个行为相同的本地桩服务，
+可以在没有合并服务的环境中测试和压测：
+
+    uvicorn app.handler.merge:stub_app --port 5000
+"""
+import asyncio
+import io
+import os
+import zipfile
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+from lxml import etree
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.errors import PyPdfError
+
+from app.handler.docx_render import DOCX_MEDIA_TYPE, merge_documents
+
+
+def merge_pdfs(contents: list) -> bytes:
+    """按顺序合并多个pdf"""
+    writer = PdfWriter()
+    for content in contents:
+        writer.append(PdfReader(io.BytesIO(content), strict=False))
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+# 可以在本进程中合并的格式：扩展名 -> (合并函数, 媒体类型)
+LOCAL_MERGERS = {
+    ".pdf": (merge_pdfs, "application/pdf"),
+    ".docx": (merge_documents, DOCX_MEDIA_TYPE),
+}
+
+
+def local_format(file_names) -> str:
+    """所有文件都是同一种可以在本进程中合并的格式时返回其扩展名，否则返回 None"""
+    extensions = {Path(name).suffix.lower() for name in file_names}
+    if len(extensions) == 1:
+        extension = extensions.pop()
+        if extension in LOCAL_MERGERS:
+            return extension
+    return None
+
+
+# 输入文件无法解析时可能抛出的异常
+INVALID_INPUT_ERRORS = (PyPdfError, zipfile.BadZipFile, etree.XMLSyntaxError, KeyError, ValueError)
+
+
+def merge_local(extension: str, contents: list, output: str) -> str:
+    """
+    在工作进程中按顺序合并同一格式的文件，结果写入 output 并返回该路径
+
+    输入文件无法解析时抛出 ValueError，进程池本身的错误原样抛出。
+    """
+    merger, _ = LOCAL_MERGERS[extension]
+    try:
+        merged = merger(contents)
+    except INVALID_INPUT_ERRORS as e:
+        # 统一转换为 ValueError，避免第三方异常跨进程传递时无法还原
+        raise ValueError(f"{type(e).__name__}: {e}") from None
+    path = Path(output)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(path.name + ".tmp")
+    temp.write_bytes(merged)
+    os.replace(temp, path)
+    return output
+
+
+def order_files(files: list, order: list) -> list:
+    """
+    按 fileOrder 排列上传的文件
+
+    order 的元素为文件名或从0开始的下标，order 中没有提到的文件按上传顺序排在最后；
+    order 为空时保持上传顺序。文件名或下标不存在时抛出 ValueError。
+    """
+    if not isinstance(order, list):
+        raise ValueError("fileOrder 应为列表")
+    by_name = {}
+    for index, file in enumerate(files):
+        by_name.setdefault(file.filename, index)
+        by_name.setdefault(Path(file.filename).name, index)
+    positions = []
+    for item in order:
+        if isinstance(item, bool) or not isinstance(item, (int, str)):
+            raise ValueError(f"无法识别的文件: {item!r}")
+        if isinstance(item, int):
+            if not 0 <= item < len(files):
+                raise ValueError(f"文件下标超出范围: {item}")
+            position = item
+        elif item in by_name:
+            position = by_name[item]
+        else:
+            raise ValueError(f"没有上传文件 {item}")
+        if position not in positions:
+            positions.append(position)
+    positions += [index for index in range(len(files)) if index not in positions]
+    return [files[index] for index in positions]
+
+
+class MergeError(Exception):
+    """合并服务返回了非 200 的状态码"""
+
+    def __init__(self, status_code: int, detail: str = ""):
+        super().__init__(f"合并服务返回 {status_code}: {detail}")
+        self.status_code = status_code
+
+
+class RemoteMergeBackend:
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 300.0,
+        connect_timeout: float = 5.0,
+        pool_timeout: float = 30.0,
+        retries: int = 2,
+        max_connections: int = 10,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.url = url
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout, pool=pool_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        )
+        self.retries = retries
+        self.transport = transport
+        self._client = None
+        self._loop = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """第一次使用时创建客户端，连接池绑定在创建它的事件循环上，事件循环变化时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                # 只重试建立连接失败的请求，已经发出的合并请求不会重复提交
+                transport=self.transport or httpx.AsyncHTTPTransport(retries=self.retries),
+            )
+        return self._client
+
+    async def merge(self, paths: list, output: str) -> dict:
+        """按 paths 的顺序合并文件，结果写入 output，返回合并服务的响应"""
+        response = await self.client.post(
+            self.url, json={"pathList": paths, "additionalString": output}
+        )
+        if response.status_code != 200:
+            raise MergeError(response.status_code, response.text)
+        return response.json()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_stub_app(delay: float = 0.0) -> FastAPI:
+    """
+    本地桩合并服务，接口与外部合并服务相同
+
+    等待 delay 秒模拟合并耗时，然后按顺序把各个文件的内容拼接写入输出路径。
+    """
+    stub = FastAPI(title="Merge stub")
+
+    @stub.post("/Merge")
+    async def merge(item: dict):
+        paths, output = item["pathList"], item["additionalString"]
+        if delay:
+            await asyncio.sleep(delay)
+
+        def concat():
+            Path(output).parent.mkdir(parents=True, exist_ok=True)
+            with open(output, "wb") as out:
+                for path in paths:
+                    out.write(Path(path).read_bytes())
+
+        await asyncio.to_thread(concat)
+        return {"message": "success", "path": output, "files": len(paths)}
+
+    return stub
+
+
+stub_app = create_stub_app()
@@ -0,0 +1,233 @@
+"""
+PDF 水印后台任务
+
+每个任务对应任务目录下的一个子目录，其中保存上传的源文件、state.json 中的任务状态
+和完成后的压缩包。状态只通过文件传递：接口进程创建任务并读取状态，工作进程执行任务
+并更新状态，请求取消时写入 cancel 标记，工作进程在处理每一页之前检查。
+因此多个服务进程共用同一个任务目录时，任意进程都可以查询、取消和下载任务结果。
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from pathlib import Path
+
+from PyPDF2 import PdfReader
+
+from app.cache import FileLRUCache
+from app.handler.pdfmarks import (
+    add_watermark,
+    add_watermark_low_memory,
+    output_name,
+    result_key,
+)
+
+# 任务状态：排队、执行中、已完成、失败、已取消
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class PdfMarkJob:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.id = self.path.name
+
+    @property
+    def source_path(self) -> Path:
+        return self.path / "source.pdf"
+
+    @property
+    def result_path(self) -> Path:
+        return self.path / "result.zip"
+
+    @property
+    def _state_path(self) -> Path:
+        return self.path / "state.json"
+
+    @property
+    def _cancel_path(self) -> Path:
+        return self.path / "cancel"
+
+    def read(self) -> dict:
+        with open(self._state_path, encoding="UTF-8") as f:
+            return json.load(f)
+
+    def write(self, state: dict):
+        # 先写临时文件再替换，读取方不会读到写了一半的状态
+        state["updated"] = time.time()
+        temp = self.path / f"state.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="UTF-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp, self._state_path)
+
+    def update(self, **fields) -> dict:
+        state = self.read()
+        state.update(fields)
+        self.write(state)
+        return state
+
+    def request_cancel(self):
+        self._cancel_path.touch()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_path.exists()
+
+
+def create_job(
+    root, file_name: str, names: list, stamp: str, compression: int, low_memory: bool = None
+) -> PdfMarkJob:
+    """
+    创建任务目录并写入初始状态，low_memory 为 None 时由源文件大小决定是否使用低内存模式
+
+    源文件由调用方写入 job.source_path，并把它的 sha256 写入状态的 digest 后再提交任务。
+    """
+    job = PdfMarkJob(Path(root) / str(uuid.uuid4()))
+    job.path.mkdir(parents=True)
+    job.write(
+        {
+            "id": job.id,
+            "status": QUEUED,
+            "file_name": file_name,
+            "names": names,
+            "stamp": stamp,
+            "compression": compression,
+            "digest": None,
+            "low_memory": low_memory,
+            "recipients": len(names),
+            "completed_recipients": 0,
+            "current_recipient": None,
+            "pages": None,
+            "current_page": 0,
+            "error": None,
+            "created": time.time(),
+        }
+    )
+    return job
+
+
+def get_job(root, job_id: str) -> PdfMarkJob:
+    """按 id 获取任务，任务不存在时抛出 KeyError"""
+    try:
+        job_id = str(uuid.UUID(job_id))
+    except ValueError:
+        raise KeyError(job_id)
+    job = PdfMarkJob(Path(root) / job_id)
+    if not job._state_path.is_file():
+        raise KeyError(job_id)
+    return job
+
+
+def cleanup_jobs(root, max_age: float, now: float = None):
+    """删除超过 max_age 秒没有更新的任务目录"""
+    root = Path(root)
+    if not root.is_dir():
+        return
+    deadline = (now or time.time()) - max_age
+    for job_dir in root.iterdir():
+        try:
+            state_path = job_dir / "state.json"
+            if state_path.is_file() and state_path.stat().st_mtime < deadline:
+                shutil.rmtree(job_dir)
+        except OSError:
+            pass
+
+
+class _Progress:
+    """记录处理进度，每页检查是否请求了取消，状态文件最多每 interval 秒写一次"""
+
+    def __init__(self, job: PdfMarkJob, state: dict, interval: float):
+        self.job = job
+        self.state = state
+        self.interval = interval
+        self._written = 0.0
+
+    def update(self, force=False, **fields):
+        self.state.update(fields)
+        now = time.monotonic()
+        if force or now - self._written >= self.interval:
+            self.job.write(self.state)
+            self._written = now
+
+    def page(self, number: int):
+        if self.job.cancel_requested:
+            raise JobCancelled()
+        self.update(current_page=number)
+
+
+def run_job(
+    job_dir: str,
+    progress_interval: float = 0.5,
+    cache_dir=None,
+    cache_max_bytes: int = 0,
+    low_memory_min_bytes: int = 0,
+):
+    """
+    在工作进程中执行任务，结果写入任务目录，异常都记录在任务状态中
+
+    cache_dir 不为空时，已经生成过的接收人直接使用结果缓存，新生成的结果也写入缓存。
+    任务没有指定 low_memory 时，源文件不小于 low_memory_min_bytes（大于0）则使用低内存模式：
+    每个接收人的结果以增量更新的方式直接写入压缩包，不经过内存，也不使用结果缓存。
+    """
+    job = PdfMarkJob(job_dir)
+    cache = FileLRUCache(cache_dir, cache_max_bytes) if cache_dir else None
+    state = job.read()
+    if job.cancel_requested:
+        job.update(status=CANCELLED)
+        return CANCELLED
+    progress = _Progress(job, state, progress_interval)
+    progress.update(force=True, status=RUNNING, started=time.time())
+    temp = job.path / "result.zip.part"
+    try:
+        digest, stamp = state["digest"], state["stamp"]
+        low_memory = state.get("low_memory")
+        if low_memory is None:
+            low_memory = 0 < low_memory_min_bytes <= job.source_path.stat().st_size
+        pdf_input = None  # 所有接收人都命中缓存时不需要解析源文件
+        with open(job.source_path, "rb") as source, zipfile.ZipFile(
+            temp, "w", state["compression"]
+        ) as zipf:
+
+            def load():
+                nonlocal pdf_input, low_memory
+                if pdf_input is None:
+                    # 直接从文件按需读取，不把源文件整个读入内存
+                    pdf_input = PdfReader(source, strict=False)
+                    low_memory = low_memory and not pdf_input.is_encrypted
+                    progress.update(force=True, pages=len(pdf_input.pages), low_memory=low_memory)
+                return pdf_input
+
+            if low_memory:
+                load()
+            for index, name in enumerate(state["names"]):
+                progress.update(current_recipient=name, current_page=0)
+                entry = output_name(name, state["file_name"])
+                text = name + " " + stamp
+                if low_memory:
+                    with zipf.open(entry, "w", force_zip64=True) as output:
+                        add_watermark_low_memory(load(), source, text, output, progress.page)
+                else:
+                    key = result_key(digest, name, stamp)
+                    content = cache.get(key) if cache is not None else None
+                    if content is None:
+                        content = add_watermark(load(), text, progress.page)
+                        if cache is not None:
+                            cache.set(key, content)
+                    zipf.writestr(entry, content)
+                progress.update(completed_recipients=index + 1)
+        os.replace(temp, job.result_path)
+        progress.update(force=True, status=DONE, current_recipient=None, finished=time.time())
+    except JobCancelled:
+        progress.update(force=True, status=CANCELLED, finished=time.time())
+    except Exception as e:
+        progress.update(force=True, status=FAILED, error=str(e), finished=time.time())
+    finally:
+        temp.unlink(missing_ok=True)
+        job.source_path.unlink(missing_ok=True)
+    return state["status"]
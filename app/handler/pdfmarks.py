@@ -1,124 +1,491 @@
-# coding:utf-8
-
-import os
-from datetime import date
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import zipfile
-
-# 指定文件路径
-new_path = os.path.dirname(__file__)
-os.chdir(new_path)
-pdfmetrics.registerFont(TTFont('msyh', './fonts/msyh.ttc'))
-
-
-def create_watermark(content):
-    """水印信息"""
-    # 默认大小为21cm*29.7cm
-    file_name = "mark.pdf"
-    c = canvas.Canvas(file_name, pagesize=(50*cm, 40*cm))
-    # 移动坐标原点(坐标系左下为(0,0))
-    #c.translate(10*cm, 5*cm)
-
-    # 设置字体
-    c.setFont("msyh", 18)
-    # 指定填充颜色
-    c.setFillColorRGB(0, 1, 0)
-    # 文字旋转
-    c.rotate(30)
-    # 指定填充颜色
-    c.setFillColorRGB(0, 0, 0, 0.3)
-
-    # 添加水印
-    for i in range(10):
-        for j in range(-20, 30):
-            a = 6.5 * i
-            b = 1.2 * (j - 1)
-            c.drawString(a*cm, b*cm, content)
-            c.setFillAlpha(0.1)
-
-    # 关闭并保存pdf文件
-    c.save()
-    return file_name
-
-
-def add_watermark(pdf_file_in, pdf_file_mark, pdf_file_out):
-    """把水印添加到pdf中"""
-    pdf_output = PdfWriter()
-    with open(pdf_file_in, 'rb') as input_stream:
-        pdf_input = PdfReader(input_stream, strict=False)
-
-        # 获取PDF文件的页数
-        pageNum = len(pdf_input.pages)
-    
-        # 读入水印pdf文件
-        pdf_watermark = PdfReader(open(pdf_file_mark, 'rb'), strict=False)
-
-        # 给每一页打水印
-        for i in range(pageNum):
-            page = pdf_input.pages[i]
-            page.merge_page(pdf_watermark.pages[0])
-            page.compress_content_streams()  # 压缩内容
-            pdf_output.add_page(page)
-        pdf_output.write(open(pdf_file_out, 'wb'))
-
-
-def zip_folder(folder_path, zip_name):
-    """打包压缩文件"""
-    with zipfile.ZipFile(zip_name, 'w') as zipf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arc_name = os.path.relpath(file_path, folder_path)
-                zipf.write(file_path, arc_name)
-
-
-def clear_folder(folder_path):
-    """清空文件夹"""
-    for fl in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, fl)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
-
-
-def pdf_marks(file_path, file_name, name_list):
-
-    # 1、获取待处理pdf文件
-    pdf_file_in = file_path
-    file_name = file_name
-
-    # 2、目标发送对象
-    name_lists = list(name_list.replace('，', ',').split(','))
-    time_marks = date.today().strftime("%Y-%m-%d")
-
-
-    watermarks = [item + ' ' + time_marks + ' ' for item in name_lists]
-
-
-    # 3、批量添加水印
-
-    i = 1
-    for name in name_lists:
-        pdf_file_out = './output/【' + name + '】' + file_name
-        watermarks = name + ' ' + time_marks
-        pdf_file_mark = create_watermark(watermarks)
-        add_watermark(pdf_file_in, pdf_file_mark, pdf_file_out)
-        # 打印完成信息
-        i = i + 1
-
-    # 4、打包压缩文件
-    folder_to_zip = './output'
-    zip_name = './zips/' + file_name.split('.')[0] + '.zip'
-    zip_folder(folder_to_zip, zip_name)
-
-    # 5、清空文件夹
-    clear_folder('./original')
-    clear_folder('./output')
-
-
-    full_path = new_path + zip_name[1:]
-
-    return full_path
+# coding:utf-8
+"""
+PDF 批量水印
+
+源文件只解析一次，每个接收人的水印和输出都在内存中生成，不再读写固定的
+original、output 目录，也不需要切换工作目录。水印按页面大小生成，
+作为各页共用的 Form XObject 引用。接收人可以分批交给进程池并行处理，
+每一批在工作进程中各自解析一次源文件。
+"""
+import hashlib
+import io
+import math
+import re
+import shutil
+import threading
+import time
+import unicodedata
+import zipfile
+from datetime import date
+from pathlib import Path
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+FONT_NAME = "msyh"
+FONT_PATH = Path(__file__).resolve().parent / "fonts" / "msyh.ttc"
+# 打包结果的目录，每个任务使用其中一个独立的子目录
+ZIP_DIR = Path(__file__).resolve().parent / "zips"
+# 打包的压缩方式，PDF 本身大多已经压缩，默认只存储不压缩
+ZIP_COMPRESSIONS = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+# 结果缓存的版本
+RESULT_VERSION = "1"
+# 水印文字的旋转角度
+WATERMARK_ANGLE = 30
+
+_font_lock = threading.Lock()
+
+
+def register_font():
+    """注册水印字体，每个进程第一次生成水印时注册一次"""
+    with _font_lock:
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(FONT_NAME, str(FONT_PATH)))
+
+
+def create_watermark(content, pagesize=(50*cm, 40*cm)) -> bytes:
+    """水印信息，返回只有一页、大小为 pagesize 的水印pdf"""
+    register_font()
+    width, height = pagesize
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=pagesize)
+
+    # 设置字体
+    c.setFont(FONT_NAME, 18)
+    # 文字旋转
+    c.rotate(WATERMARK_ANGLE)
+    # 指定填充颜色
+    c.setFillColorRGB(0, 0, 0, 0.1)
+
+    # 旋转后的坐标系中，页面覆盖的范围为
+    # x: [0, w*cos + h*sin]，y: [-w*sin, h*cos]，按行列间距铺满这个范围
+    cos, sin = math.cos(math.radians(WATERMARK_ANGLE)), math.sin(math.radians(WATERMARK_ANGLE))
+    columns = math.ceil((width * cos + height * sin) / (6.5*cm)) + 1
+    rows = range(math.floor(-width * sin / (1.2*cm)), math.ceil(height * cos / (1.2*cm)) + 1)
+    for i in range(-1, columns):
+        for j in rows:
+            c.drawString(6.5 * i * cm, 1.2 * j * cm, content)
+
+    c.save()
+    return buffer.getvalue()
+
+
+def _page_box(page):
+    """页面 mediabox 的 (左, 下, 宽, 高)"""
+    box = page.mediabox
+    return (float(box.left), float(box.bottom), float(box.width), float(box.height))
+
+
+def _decoded_stream(data: bytes) -> DecodedStreamObject:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return stream
+
+
+def _shallow_copy(obj) -> DictionaryObject:
+    """复制字典本身，其中的间接引用保持不变"""
+    copy = DictionaryObject()
+    dict.update(copy, dict.items(obj))
+    return copy
+
+
+class _WriterTarget:
+    """普通模式：页面复制到 PdfWriter 中修改，最后整体写出"""
+
+    def __init__(self):
+        self.writer = PdfWriter()
+
+    def add(self, obj):
+        return self.writer._add_object(obj)
+
+    def import_object(self, obj):
+        return obj.get_object().clone(self.writer)
+
+    def page(self, page):
+        # add_page 返回写入 writer 的副本，只修改副本
+        return self.writer.add_page(page)
+
+    def editable(self, container, key) -> DictionaryObject:
+        if key not in container:
+            container[NameObject(key)] = DictionaryObject()
+        return container[key]
+
+    def page_done(self, page):
+        pass
+
+
+class _CountingWriter:
+    def __init__(self, output):
+        self.output = output
+        self.position = 0
+
+    def write(self, data) -> int:
+        self.output.write(data)
+        self.position += len(data)
+        return len(data)
+
+
+class _IncrementalUpdate:
+    """
+    低内存模式：按 PDF 增量更新的方式，把修改过的对象追加在源文件之后
+
+    源文件原样复制到输出，之后每处理一页就写出修改后的页面对象，
+    页面引用的图片、字体等对象既不读取也不复制，只有新增和修改的对象会被追加，
+    最后写入新的交叉引用表，其 /Prev 指向源文件原有的交叉引用表。
+    """
+
+    def __init__(self, pdf_input: PdfReader, source, output):
+        self.pdf_input = pdf_input
+        self.output = _CountingWriter(output)
+        # 交叉引用流中的 /Size 不会出现在 PyPDF2 的 trailer 中，同时参考已知的最大对象号
+        known = [idnum for refs in pdf_input.xref.values() for idnum in refs]
+        known += list(pdf_input.xref_objStm)
+        self.next_id = max(int(pdf_input.trailer.get("/Size", 0)), max(known, default=0) + 1)
+        self.offsets = {}  # 对象号 -> (偏移, 代号)
+        self._edited = {}  # 本次修改过的间接对象：对象号 -> (代号, 副本)
+        self._page_ref = None
+
+        source.seek(0, io.SEEK_END)
+        size = source.tell()
+        source.seek(max(0, size - 2048))
+        tail = source.read()
+        found = re.findall(rb"startxref\s+(\d+)", tail)
+        if not found:
+            raise ValueError("找不到 startxref，无法增量更新")
+        self.prev = int(found[-1])
+        source.seek(self.prev)
+        self.xref_stream = not source.read(4).startswith(b"xref")
+        source.seek(0)
+        shutil.copyfileobj(source, self.output, 1024 * 1024)
+        self.output.write(b"\n")
+
+    def _reserve(self) -> IndirectObject:
+        ref = IndirectObject(self.next_id, 0, None)
+        self.next_id += 1
+        return ref
+
+    def write(self, idnum: int, generation: int, obj):
+        self.offsets[idnum] = (self.output.position, generation)
+        self.output.write(b"%d %d obj\n" % (idnum, generation))
+        obj.write_to_stream(self.output, None)
+        self.output.write(b"\nendobj\n")
+
+    def add(self, obj) -> IndirectObject:
+        ref = self._reserve()
+        self.write(ref.idnum, ref.generation, obj)
+        return ref
+
+    def import_object(self, obj, imported=None):
+        """把水印pdf中的对象连同它引用的对象一起追加，对象号重新分配"""
+        if imported is None:
+            imported = {}  # 水印pdf中的对象号 -> 新的引用
+        if isinstance(obj, IndirectObject):
+            if obj.idnum not in imported:
+                ref = imported[obj.idnum] = self._reserve()
+                self.write(ref.idnum, 0, self.import_object(obj.get_object(), imported))
+            return imported[obj.idnum]
+        if isinstance(obj, DictionaryObject):
+            if isinstance(obj, StreamObject):
+                copy = obj.__class__()
+                copy._data = obj._data
+            else:
+                copy = DictionaryObject()
+            for key, value in dict.items(obj):
+                copy[key] = self.import_object(value, imported)
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.import_object(value, imported) for value in obj)
+        return obj
+
+    def page(self, page):
+        self._page_ref = page.indirect_reference
+        return _shallow_copy(page)
+
+    def editable(self, container, key) -> DictionaryObject:
+        """返回 container[key] 的可修改副本，源文件中的对象不会被修改"""
+        value = dict.get(container, key)
+        if isinstance(value, IndirectObject):
+            if value.idnum not in self._edited:
+                self._edited[value.idnum] = (value.generation, _shallow_copy(value.get_object()))
+            return self._edited[value.idnum][1]
+        copy = DictionaryObject() if value is None else _shallow_copy(value)
+        container[NameObject(key)] = copy
+        return copy
+
+    def page_done(self, page):
+        self.write(self._page_ref.idnum, self._page_ref.generation, page)
+
+    def finish(self):
+        """写出修改过的共用对象和交叉引用表"""
+        for idnum, (generation, obj) in self._edited.items():
+            self.write(idnum, generation, obj)
+        trailer = DictionaryObject()
+        for key in ("/Root", "/Info", "/ID"):
+            if key in self.pdf_input.trailer:
+                trailer[NameObject(key)] = dict.get(self.pdf_input.trailer, key)
+        trailer[NameObject("/Prev")] = NumberObject(self.prev)
+        if self.xref_stream:
+            self._write_xref_stream(trailer)
+        else:
+            self._write_xref_table(trailer)
+
+    def _sections(self):
+        """把对象号分为连续的段，产出 (起始对象号, [(偏移, 代号), ...])"""
+        section = []
+        for idnum in sorted(self.offsets):
+            if section and idnum != section[-1] + 1:
+                yield section[0], [self.offsets[i] for i in section]
+                section = []
+            section.append(idnum)
+        if section:
+            yield section[0], [self.offsets[i] for i in section]
+
+    def _write_xref_table(self, trailer):
+        position = self.output.position
+        # 第一段总是对象 0（空闲链表的表头），部分阅读器依赖这一点判断对象号是否从 0 开始
+        self.output.write(b"xref\n0 1\n0000000000 65535 f\r\n")
+        for start, entries in self._sections():
+            self.output.write(b"%d %d\n" % (start, len(entries)))
+            for offset, generation in entries:
+                self.output.write(b"%010d %05d n\r\n" % (offset, generation))
+        trailer[NameObject("/Size")] = NumberObject(self.next_id)
+        self.output.write(b"trailer\n")
+        trailer.write_to_stream(self.output, None)
+        self.output.write(b"\nstartxref\n%d\n%%%%EOF\n" % position)
+
+    def _write_xref_stream(self, trailer):
+        # 源文件使用交叉引用流时，更新部分也使用交叉引用流
+        ref = self._reserve()
+        position = self.output.position
+        self.offsets[ref.idnum] = (position, 0)
+        index, data = [NumberObject(0), NumberObject(1)], bytearray(b"\x00" + bytes(8) + b"\xff\xff")
+        for start, entries in self._sections():
+            index += [NumberObject(start), NumberObject(len(entries))]
+            for offset, generation in entries:
+                data += b"\x01" + offset.to_bytes(8, "big") + generation.to_bytes(2, "big")
+        xref = _decoded_stream(bytes(data))
+        xref.update(trailer)
+        xref.update({
+            NameObject("/Type"): NameObject("/XRef"),
+            NameObject("/Size"): NumberObject(self.next_id),
+            NameObject("/Index"): ArrayObject(index),
+            NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(8), NumberObject(2)]),
+        })
+        self.output.write(b"%d 0 obj\n" % ref.idnum)
+        xref.write_to_stream(self.output, None)
+        self.output.write(b"\nendobj\nstartxref\n%d\n%%%%EOF\n" % position)
+
+
+def _watermark_form(target, content: str, width: float, height: float):
+    """把与页面等大的水印作为 Form XObject 写入 target，返回它的引用"""
+    mark = PdfReader(io.BytesIO(create_watermark(content, (width, height))), strict=False).pages[0]
+    form = _decoded_stream(mark["/Contents"].get_object().get_data()).flate_encode()
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject(
+            [FloatObject(0), FloatObject(0), FloatObject(round(width, 4)), FloatObject(round(height, 4))]
+        ),
+        NameObject("/Resources"): target.import_object(dict.get(mark, "/Resources")),
+    })
+    return target.add(form)
+
+
+def _stamp_pages(target, pages, content: str, progress=None):
+    """
+    每种页面大小只生成一个水印 Form XObject，各页只在内容末尾引用它，
+    不需要解析或复制页面原有的内容流，输出大小几乎不随页数增加。
+    """
+    # 各页共用的内容流：开头保存图形状态，末尾恢复后绘制水印
+    save_state = target.add(_decoded_stream(b"q\n"))
+    stamps = {}
+    for number, page in enumerate(pages, start=1):
+        if progress is not None:
+            progress(number)
+        left, bottom, width, height = box = _page_box(page)
+        page = target.page(page)
+        if box not in stamps:
+            name = NameObject(f"/PdfMark{len(stamps)}")
+            form = _watermark_form(target, content, width, height)
+            draw = target.add(
+                _decoded_stream(b"\nQ q 1 0 0 1 %.4f %.4f cm %s Do Q\n" % (left, bottom, name.encode()))
+            )
+            stamps[box] = (name, form, draw)
+        name, form, draw = stamps[box]
+
+        resources = target.editable(page, "/Resources")
+        target.editable(resources, "/XObject")[name] = form
+
+        contents = dict.get(page, "/Contents")
+        if contents is None:
+            contents = []
+        elif isinstance(contents.get_object(), ArrayObject):
+            contents = list(contents.get_object())
+        else:
+            contents = [contents]
+        page[NameObject("/Contents")] = ArrayObject([save_state, *contents, draw])
+        target.page_done(page)
+
+
+def add_watermark(pdf_input: PdfReader, content: str, progress=None) -> bytes:
+    """
+    把水印添加到已解析的pdf的每一页，返回新的pdf，pdf_input 本身不会被修改
+
+    progress 不为空时在处理每一页之前以页码（从1开始）调用，可以在其中抛出异常中止处理。
+    """
+    target = _WriterTarget()
+    _stamp_pages(target, pdf_input.pages, content, progress)
+    buffer = io.BytesIO()
+    target.writer.write(buffer)
+    return buffer.getvalue()
+
+
+def add_watermark_low_memory(pdf_input: PdfReader, source, content: str, output, progress=None):
+    """
+    低内存模式：以增量更新的方式添加水印，结果边生成边写入 output
+
+    pdf_input 应直接从文件对象 source 读取（而不是先读入内存），源文件原样复制到 output，
+    之后只追加每页修改后的页面对象和水印，内存占用与页面大小、页数基本无关，
+    适合上千页的扫描件。加密的pdf无法增量更新，会抛出 ValueError。
+    """
+    if pdf_input.is_encrypted:
+        raise ValueError("加密的pdf不支持低内存模式")
+    target = _IncrementalUpdate(pdf_input, source, output)
+    _stamp_pages(target, pdf_input.pages, content, progress)
+    target.finish()
+
+
+def normalize_name(name: str) -> str:
+    """统一全角/半角字符并合并连续空白，写法不同的同一个姓名生成相同的水印"""
+    return " ".join(unicodedata.normalize("NFKC", name).split())
+
+
+def parse_names(name_list: str) -> list:
+    """把逗号（中英文均可）分隔的姓名解析为列表，去掉空白和重复的姓名"""
+    names = (normalize_name(name) for name in name_list.replace('，', ',').split(','))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def result_key(digest: str, name: str, stamp: str) -> str:
+    """结果缓存的键，由源文件的 sha256、接收人和日期决定，水印的生成方式改变时更新 RESULT_VERSION"""
+    key = "\0".join((RESULT_VERSION, digest, name, stamp))
+    return hashlib.sha256(key.encode("UTF-8")).hexdigest()
+
+
+def cached_results(cache, digest: str, names, stamp: str) -> dict:
+    """从结果缓存中取出已经生成过的 {姓名: pdf}"""
+    results = {}
+    for name in names:
+        content = cache.get(result_key(digest, name, stamp))
+        if content is not None:
+            results[name] = content
+    return results
+
+
+def store_results(cache, digest: str, stamp: str, results):
+    for name, content in results:
+        cache.set(result_key(digest, name, stamp), content)
+
+
+def time_mark(day: date = None) -> str:
+    return (day or date.today()).strftime("%Y-%m-%d")
+
+
+def output_name(name: str, file_name: str) -> str:
+    return '【' + name + '】' + Path(file_name).name
+
+
+def watermark_pdf(source: bytes, names, stamp: str):
+    """逐个产出 (姓名, 加了水印的pdf)，源文件只解析一次"""
+    pdf_input = PdfReader(io.BytesIO(source), strict=False)
+    for name in names:
+        yield name, add_watermark(pdf_input, name + ' ' + stamp)
+
+
+def watermark_batch(source: bytes, names, stamp: str) -> list:
+    """在工作进程中处理一批接收人"""
+    return list(watermark_pdf(source, names, stamp))
+
+
+def split_batches(names: list, count: int) -> list:
+    """把接收人按顺序分为最多 count 批，各批数量相差不超过1"""
+    count = max(1, min(count, len(names)))
+    size, extra = divmod(len(names), count)
+    batches, start = [], 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        batches.append(names[start:end])
+        start = end
+    return batches
+
+
+def write_zip(zip_path, file_name: str, results, compression: int = zipfile.ZIP_STORED) -> Path:
+    """把 (姓名, pdf) 写入压缩包"""
+    zip_path = Path(zip_path)
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(zip_path, 'w', compression) as zipf:
+        for name, content in results:
+            zipf.writestr(output_name(name, file_name), content)
+    return zip_path
+
+
+class ZipStream:
+    """
+    只能追加写入的内存缓冲，作为 ZipFile 的输出实现边生成边发送
+
+    不支持 seek，ZipFile 会在每个文件后写入数据描述符，而不是回头修改文件头，
+    每写入一个文件后用 drain() 取出已经生成的部分发送给客户端。
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def cleanup_zips(max_age: float, now: float = None):
+    """删除 ZIP_DIR 中超过 max_age 秒的任务目录"""
+    if not ZIP_DIR.is_dir():
+        return
+    deadline = (now or time.time()) - max_age
+    for job_dir in ZIP_DIR.iterdir():
+        try:
+            if job_dir.is_dir() and job_dir.stat().st_mtime < deadline:
+                shutil.rmtree(job_dir)
+        except OSError:
+            # 可能已被其他进程删除
+            pass
+
+
+def pdf_marks(source: bytes, file_name: str, name_list: str, zip_path) -> Path:
+    """在当前进程中为每个接收人添加水印并打包，返回压缩包路径"""
+    names = parse_names(name_list)
+    return write_zip(zip_path, file_name, watermark_pdf(source, names, time_mark()))
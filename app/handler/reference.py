@@ -0,0 +1,73 @@
+"""
+参考资料配置
+
+配置文件只在修改时间或大小变化时重新读取，读取后按名称建立索引。
+为避免每个请求都访问文件系统，两次检查文件状态之间至少间隔 check_interval 秒，
+间隔内的请求直接使用内存中的配置。
+"""
+import hashlib
+import json
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+
+class ReferenceSnapshot:
+    """某一版本的配置内容，以及对应的 ETag 和 Last-Modified"""
+
+    def __init__(self, config: dict, content: bytes, mtime: float):
+        self.reference = config["reference"]
+        self.by_name = {}
+        for item in self.reference:
+            # 与原来的线性查找一致，同名时以第一个为准
+            self.by_name.setdefault(item["name"], item["content"])
+        self.etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        self.mtime = int(mtime)
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+
+    def not_modified(self, if_none_match=None, if_modified_since=None) -> bool:
+        """按请求的条件头判断客户端缓存是否仍然有效，If-None-Match 优先"""
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or any(
+                tag.removeprefix("W/") == self.etag for tag in tags
+            )
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return since.timestamp() >= self.mtime
+        return False
+
+
+class ReferenceConfig:
+    def __init__(self, path, check_interval: float = 1.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> ReferenceSnapshot:
+        """返回当前配置，文件变化后第一次调用时重新读取"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot
+            stat = self.path.stat()
+            version = (stat.st_mtime_ns, stat.st_size)
+            if version != self._version or self._snapshot is None:
+                with open(self.path, "rb") as f:
+                    content = f.read()
+                self._snapshot = ReferenceSnapshot(
+                    json.loads(content.decode("UTF-8")), content, stat.st_mtime
+                )
+                self._version = version
+            self._checked_at = now
+            return self._snapshot
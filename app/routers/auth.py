@@ -2,11 +2,11 @@ from datetime import timedelta
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.sql_app import crud, schemas
+from app.sql_app import async_crud, crud, schemas
 
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 
 router = APIRouter(
     tags=["登录注册"],
@@ -18,13 +18,13 @@ router = APIRouter(
 @router.post("/token")
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ) -> schemas.Token:
     """
     登录获取访问令牌
     """
     try:
-        user = crud.authenticate_user(
+        user = await async_crud.authenticate_user(
             db, name=form_data.username, hashed_password=form_data.password
         )
     except Exception as e:
@@ -48,7 +48,11 @@ async def login_for_access_token(
 
 
 @router.post("/users/signup", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(
+    user: schemas.UserCreate,
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
+):
     """
     创建新用户
 
@@ -56,7 +60,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
     参数:
     - user (schemas.UserCreate): 包含用户注册信息的Pydantic模型，通常包括用户名、邮箱和密码。
-    - db (Session): 数据库会话对象，由FastAPI的依赖注入系统提供。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
 
     流程:
     1. 首先检查数据库中是否已存在使用相同邮箱的用户。
@@ -67,13 +71,16 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     - schemas.User: 返回新创建的用户信息，包括自动生成的用户ID。
 
     异常:
-    - HTTPException: 如果邮箱已被注册，则抛出状态码为400的HTTP异常。
+    - HTTPException: 如果邮箱或用户名已被注册，则抛出状态码为400的HTTP异常。
 
     注意:
     - 此函数使用 @app.post 装饰器，表示它响应 POST 请求到 "/users/" 路径。
     - response_model=schemas.User 指定了响应的数据模型，确保返回的数据符合User模式。
     """
-    db_user = crud.get_user_by_email(db, email=user.email)
+    # 重复检查使用只读连接，写连接只在插入新用户时占用，不会在密码哈希期间被占住
+    db_user = await async_crud.get_user_by_email(read_db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="邮箱已注册")
-    return crud.create_user(db=db, user=user)
+    if await async_crud.get_user_by_name(read_db, name=user.name):
+        raise HTTPException(status_code=400, detail="用户名已注册")
+    return await async_crud.create_user(db=db, user=user)
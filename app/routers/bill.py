@@ -1,19 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from app.dependencies import get_current_active_user, get_db
-
-from sqlalchemy.orm import Session
-from app.sql_app import crud, schemas
-
-from typing import Annotated, List
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Response,
+    UploadFile,
+)
+from fastapi.responses import StreamingResponse
+from app.dependencies import get_current_active_user, get_db, get_read_db
+from app.handler import bill_import
+from app.setting import settings
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.sql_app import async_crud, crud, schemas
+from app.sql_app.database import AsyncReadSessionLocal
+
+from datetime import date, datetime, timedelta
+
+from typing import Annotated, List, Optional
 
 router = APIRouter(tags=["账单相关"])
 
 
 @router.post("/current_users/add_bills/", response_model=schemas.Bill)
-def create_bill_for_user(
+async def create_bill_for_user(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
     bill: schemas.BillCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     为指定用户创建账单
@@ -30,14 +45,106 @@ def create_bill_for_user(
     异常:
     - HTTPException: 如果用户不存在，则抛出状态码为404的HTTP异常。
     """
-    return crud.create_bill(db=db, bill=bill, user_id=current_user.user_id)
+    return await async_crud.create_bill(db=db, bill=bill, user_id=current_user.id)
+
+
+@router.post("/current_users/import_bills/", response_model=schemas.BillImportResult)
+async def import_bills_for_user(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Form(None, alias="format"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    为当前用户批量导入账单
+
+    此函数逐行读取上传的 CSV（带表头）或 NDJSON 文件，每行包含 bill_date、summary、amount、handle，
+    按批次插入数据库，内存占用与文件大小无关。
+
+    参数:
+    - file (UploadFile): 上传的账单文件。
+    - format (str): 文件格式，csv 或 ndjson，不传时根据文件名或 Content-Type 判断。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
+
+    返回:
+    - schemas.BillImportResult: 导入成功和失败的数量，以及每个失败行的错误信息。
+
+    异常:
+    - HTTPException: 如果无法判断文件格式，则抛出状态码为400的HTTP异常。
+    """
+    file_format = file_format or bill_import.detect_format(
+        file.filename, file.content_type
+    )
+    if file_format not in (bill_import.CSV_FORMAT, bill_import.NDJSON_FORMAT):
+        raise HTTPException(status_code=400, detail="仅支持 csv 或 ndjson 格式的文件")
+    return await async_crud.import_bills(
+        db,
+        bill_import.iter_rows(file.file, file_format),
+        user_id=current_user.id,
+        batch_size=settings.bulk_import_batch_size,
+        max_errors=settings.bulk_import_max_errors,
+    )
+
+
+@router.get("/current_users/export_bills/")
+async def export_bills_for_user(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    file_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    start: Optional[date] = Query(None, description="开始日期（含）"),
+    end: Optional[date] = Query(None, description="结束日期（含）"),
+):
+    """
+    导出当前用户的账单
+
+    此函数按日期顺序以流的形式导出当前用户的账单，导出的文件可以直接用于批量导入。
+    数据库按批读取，内存占用与导出的行数无关。
+
+    参数:
+    - format (str): 文件格式，csv（默认）或 ndjson。
+    - start (date): 开始日期（含），不传时不限制。
+    - end (date): 结束日期（含），不传时不限制。
+
+    返回:
+    - StreamingResponse: 账单文件。
+    """
+    start_time = datetime.combine(start, datetime.min.time()) if start else None
+    end_time = (
+        datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+    )
+    encode = (
+        bill_import.encode_csv_rows
+        if file_format == bill_import.CSV_FORMAT
+        else bill_import.encode_ndjson_rows
+    )
+    user_id = current_user.id
+
+    async def content():
+        if file_format == bill_import.CSV_FORMAT:
+            yield bill_import.csv_header()
+        # 依赖项中的会话在响应开始发送前就会关闭，这里单独使用一个只读会话
+        async with AsyncReadSessionLocal() as db:
+            async for rows in async_crud.stream_user_bills(
+                db, user_id, start_time, end_time, settings.export_batch_size
+            ):
+                yield encode(rows)
+
+    return StreamingResponse(
+        content(),
+        media_type=bill_import.MEDIA_TYPES[file_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="bills.{file_format}"'
+        },
+    )
 
 
 @router.get("/current_users/month_bills/", response_model=List[schemas.Bill])
-def get_user_bills(
+async def get_user_bills(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
-    month: int = Query(..., description="Month (1-12)"),
-    db: Session = Depends(get_db),
+    month: int = Query(..., ge=1, le=12, description="Month (1-12)"),
+    year: Optional[int] = Query(
+        None, ge=1, le=9998, description="Year, defaults to the current year"
+    ),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     按月获取当前用户的账单
@@ -47,35 +154,87 @@ def get_user_bills(
     参数:
     - user_id (int): 用户ID。
     - month (int): 月份。
-    - db (Session): 数据库会话对象，由FastAPI的依赖注入系统提供。
+    - year (int): 年份，默认为当前年份。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
     """
-    bills = crud.get_user_bills(db, user_id=current_user.id, month=month)
+    bills = await async_crud.get_user_bills(
+        db, user_id=current_user.id, month=month, year=year
+    )
     if bills is None or len(bills) == 0:
         raise HTTPException(status_code=404, detail="本月无账单明细内容。")
     return bills
 
 
+@router.get("/current_users/report/", response_model=schemas.Report)
+async def get_user_report(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    year: Optional[int] = Query(
+        None, ge=1, le=9998, description="Year, defaults to the current year"
+    ),
+    granularity: str = Query("month", pattern="^(month|day)$"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    获取当前用户的年度收支报表
+
+    此函数用一条聚合查询统计当前用户某一年每月（或每天）的收入、已结算支出、未结算支出和净额。
+
+    参数:
+    - year (int): 年份，默认为当前年份。
+    - granularity (str): 统计粒度，month（默认）或 day。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
+
+    返回:
+    - schemas.Report: 按时间排序的统计结果，没有账单的月份或日期不会出现在结果中。
+    """
+    if year is None:
+        year = datetime.now().year
+    periods = await async_crud.get_user_report(
+        db, user_id=current_user.id, year=year, granularity=granularity
+    )
+    return {"year": year, "granularity": granularity, "periods": periods}
+
+
 @router.get("/bills/", response_model=List[schemas.Bill])
-def read_bills(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_bills(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
     """
     读取账单列表
 
-    此函数用于从数据库中读取账单列表。
+    此函数用于从数据库中读取账单列表，按账单ID排序。
 
     参数:
-    - skip (int): 跳过前多少个账单，默认为0。
+    - skip (int): 跳过前多少个账单，默认为0。传入cursor时忽略。
     - limit (int): 限制返回的账单数量，默认为100。
-    - db (Session): 数据库会话对象，由FastAPI的依赖注入系统提供。
+    - cursor (str): 上一页响应头 X-Next-Cursor 中的游标，传入后按游标翻页，每页耗时不随页数增加。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
 
     返回:
-    - List[schemas.Bill]: 返回账单列表。
+    - List[schemas.Bill]: 返回账单列表。还有下一页时，响应头 X-Next-Cursor 中带有下一页的游标。
+
+    异常:
+    - HTTPException: 如果游标无效，则抛出状态码为400的HTTP异常。
     """
-    bills = crud.get_bills(db, skip=skip, limit=limit)
+    after_id = None
+    if cursor is not None:
+        try:
+            after_id = crud.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    bills = await async_crud.get_bills(db, skip=skip, limit=limit, after_id=after_id)
+    cursor = crud.next_cursor(bills, limit)
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = cursor
     return bills
 
 
 @router.get("/bills/{bill_id}", response_model=schemas.Bill)
-def read_bill(bill_id: int, db: Session = Depends(get_db)):
+async def read_bill(bill_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     读取指定单个账单信息
 
@@ -83,7 +242,7 @@ def read_bill(bill_id: int, db: Session = Depends(get_db)):
 
     参数:
     - bill_id (int): 账单ID。
-    - db (Session): 数据库会话对象，由FastAPI的依赖注入系统提供。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
 
     返回:
     - schemas.Bill: 返回指定账单的信息。
@@ -91,14 +250,16 @@ def read_bill(bill_id: int, db: Session = Depends(get_db)):
     异常:
     - HTTPException: 如果账单不存在，则抛出状态码为404的HTTP异常。
     """
-    db_bill = crud.get_bill(db, bill_id=bill_id)
+    db_bill = await async_crud.get_bill(db, bill_id=bill_id)
     if db_bill is None:
         raise HTTPException(status_code=404, detail="Bill not found")
     return db_bill
 
 
 @router.put("/bills/{bill_id}", response_model=schemas.Bill)
-def update_bill(bill_id: int, bill: schemas.BillUpdate, db: Session = Depends(get_db)):
+async def update_bill(
+    bill_id: int, bill: schemas.BillUpdate, db: AsyncSession = Depends(get_db)
+):
     """
     更新指定账单信息
 
@@ -114,14 +275,14 @@ def update_bill(bill_id: int, bill: schemas.BillUpdate, db: Session = Depends(ge
     异常:
     - HTTPException: 如果账单不存在，则抛出状态码为404的HTTP异常。
     """
-    db_bill = crud.update_bill(db, bill_id=bill_id, bill=bill)
+    db_bill = await async_crud.update_bill(db, bill_id=bill_id, bill=bill)
     if db_bill is None:
         raise HTTPException(status_code=404, detail="Bill not found")
     return db_bill
 
 
 @router.delete("/bills/{bill_id}", response_model=schemas.Bill)
-def delete_bill(bill_id: int, db: Session = Depends(get_db)):
+async def delete_bill(bill_id: int, db: AsyncSession = Depends(get_db)):
     """
     删除指定账单
 
@@ -129,7 +290,7 @@ def delete_bill(bill_id: int, db: Session = Depends(get_db)):
 
     参数:
     - bill_id (int): 账单ID。
-    - db (Session): 数据库会话对象，由FastAPI的依赖注入系统提供。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
 
     返回:
     - schemas.Bill: 返回删除的账单信息。
@@ -137,7 +298,7 @@ def delete_bill(bill_id: int, db: Session = Depends(get_db)):
     异常:
     - HTTPException: 如果账单不存在，则抛出状态码为404的HTTP异常。
     """
-    db_bill = crud.delete_bill(db, bill_id=bill_id)
+    db_bill = await async_crud.delete_bill(db, bill_id=bill_id)
     if db_bill is None:
         raise HTTPException(status_code=404, detail="Bill not found")
     return db_bill
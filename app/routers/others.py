@@ -1,53 +1,130 @@
 from pathlib import Path
-from fastapi import APIRouter, File, HTTPException, UploadFile, Form, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Request, UploadFile, Form, Query
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 
 from app.logger import main_logger
 
 from app.setting import settings
 
-from typing import List
+from typing import List, Literal, Optional
 
+import asyncio
+import hashlib
 import os
+import time
+from functools import partial
 import shutil
 import json
 import uuid
-import requests
-from bs4 import BeautifulSoup
-from docxtpl import DocxTemplate
-from app.handler.pdfmarks import pdf_marks
+import zipfile
+from urllib.parse import quote
+import aiofiles
+import httpx
+from pydantic import BaseModel
+from app.handler import docx_render
+from app.handler.docx_render import DOCX_MEDIA_TYPE, TemplateRegistry
+from app.workers import cpu_pool, job_pool
+from app.cache import FileLRUCache
+from app.handler.meeting import MeetingTemplate, parse_rows
+from app.handler.merge import (
+    LOCAL_MERGERS,
+    MergeError,
+    RemoteMergeBackend,
+    local_format,
+    merge_local,
+    order_files,
+)
+from app.handler.reference import ReferenceConfig
+from app.handler.pdfmark_jobs import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    FINISHED,
+    QUEUED,
+    cleanup_jobs,
+    create_job,
+    get_job,
+    run_job,
+)
+from app.handler.pdfmarks import (
+    ZIP_COMPRESSIONS,
+    ZIP_DIR,
+    ZipStream,
+    cached_results,
+    cleanup_zips,
+    output_name,
+    parse_names,
+    split_batches,
+    store_results,
+    time_mark,
+    watermark_batch,
+    write_zip,
+)
 
-## 引用模板，用于生成docx文件
-doc = DocxTemplate(settings.template)  ## 请修改为自己的模板路径
+## 模板目录，用于按名称生成docx文件；/render/ 使用的默认模板也由它缓存
+templates = TemplateRegistry(settings.template_directory, settings.template_cache_size)
+
+## PDF 水印结果缓存，按源文件摘要、接收人和日期保存每个接收人的结果
+result_cache = FileLRUCache(settings.pdfmarks_cache_directory, settings.pdfmarks_cache_max_bytes)
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+## 读取上传文件的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+## 外部合并服务，共享一个连接池
+merge_backend = RemoteMergeBackend(
+    settings.merge_service_url,
+    timeout=settings.merge_timeout,
+    connect_timeout=settings.merge_connect_timeout,
+    pool_timeout=settings.merge_pool_timeout,
+    retries=settings.merge_retries,
+    max_connections=settings.merge_max_connections,
+)
+
+## 参考资料配置，文件修改后自动重新读取
+reference_config = ReferenceConfig(settings.config, settings.reference_check_interval)
 
 ## 模板内容，请更新为您的模板内容
-models: str = "{time}&emsp;&emsp;&emsp;{name}<br/>会议负责人：<br/>会议分类：<br/>关注内容：<br/><br/>{url}<br/>"
+meeting_template = MeetingTemplate(
+    "{time}&emsp;&emsp;&emsp;{name}<br/>会议负责人：<br/>会议分类：<br/>关注内容：<br/><br/>{url}<br/>"
+)
 
 router = APIRouter(tags=["其他API"])
 
 
 @router.get("/reference/")
-def read_reference(weekday: str | None = None):
+def read_reference(
+    weekday: str | None = None,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
     main_logger.info(f"Accessing reference data. Weekday: {weekday}")
-    f = open(settings.config, "r", encoding="UTF-8")
-    config = json.load(f)
+    snapshot = reference_config.get()
+    headers = {
+        "ETag": snapshot.etag,
+        "Last-Modified": snapshot.last_modified,
+        "Cache-Control": "no-cache",
+    }
+    if snapshot.not_modified(if_none_match, if_modified_since):
+        main_logger.info("Reference data not modified")
+        return Response(status_code=304, headers=headers)
     if weekday is not None:
-        for i in config["reference"]:
-            if i["name"] == weekday:
-                data = i["content"]
-                main_logger.info(f"Returning reference data for weekday: {weekday}")
-                return data
+        data = snapshot.by_name.get(weekday)
+        main_logger.info(f"Returning reference data for weekday: {weekday}")
     else:
-        data = config["reference"]
+        data = snapshot.reference
         main_logger.info("Returning all reference data")
-        return data
+    return JSONResponse(data, headers=headers)
 
 
 @router.post("/meeting/settings/")
-def settings(item: dict):
-    global models
+def meeting_settings(item: dict):
+    global meeting_template
     main_logger.info(f"Updating meeting settings: {item}")
-    models = item["item"]
+    try:
+        meeting_template = MeetingTemplate(item["item"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return "成功设置"
 
 
@@ -55,31 +132,9 @@ def settings(item: dict):
 def meeting(item: dict):
     main_logger.info("Processing meeting data")
     data = item["item"]
-    soup = BeautifulSoup(data, "html.parser")
-    table = soup.find("table")
-    temple = []
+    template = meeting_template
     try:
-        for row in table.find_all("tr"):
-            cell = row.find_all("td")
-            try:
-                time = (  # noqa: F841
-                    (cell[0].text)
-                    .replace(" ", "")
-                    .replace("\n", "")
-                    .replace(":", "：")
-                    .split("-")[0]
-                )
-            except Exception as e:  # noqa: F841
-                time = ""  # noqa: F841
-            try:
-                name = (cell[1].text).replace(" ", "").replace("\n", "").split("【")[0]  # noqa: F841
-            except Exception as e:  # noqa: F841
-                name = ""  # noqa: F841
-            try:
-                url = cell[2].find("a").get("href")  # noqa: F841
-            except Exception as e:  # noqa: F841
-                url = ""  # noqa: F841
-            temple.append(eval(f'f"{models}"'))
+        temple = [template.format(**row) for row in parse_rows(data)]
     except Exception as e:
         main_logger.error(f"Error processing meeting data: {e}")
         return {"data": "没有可解析内容"}
@@ -87,88 +142,455 @@ def meeting(item: dict):
     return {"data": temple}
 
 
+def docx_response(content: bytes, filename: str = "result.docx"):
+    return Response(
+        content,
+        media_type=DOCX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.post("/render/")
 def renderDocx(item: dict):
-    doc.render(item)
-    doc.save("result.docx")
-    return FileResponse("result.docx")
+    content = templates.load(settings.template).render(item)  ## 请修改为自己的模板路径
+    return docx_response(content)
+
+
+@router.get("/templates/")
+def list_templates():
+    """列出模板目录中可用于渲染的模板"""
+    return templates.names()
+
+
+class BatchRenderItem(BaseModel):
+    contexts: List[dict]  # 每个文档的渲染数据
+    template: Optional[str] = None  # 模板目录中的模板名称，不传时使用默认模板
+    output: Literal["zip", "merged"] = "zip"  # 打包为zip，或合并为一个文档
+
+
+@router.post("/render/batch/")
+async def render_batch(item: BatchRenderItem):
+    """
+    批量生成docx文件
+
+    每个渲染数据在进程池中并行渲染，单个文档失败不影响其他文档。
+    output 为 zip 时返回包含各个文档的压缩包，失败项记录在其中的 errors.json；
+    为 merged 时返回用 docxcompose 合并后的单个文档，失败项记录在响应头 X-Render-Errors 中。
+    """
+    if not item.contexts:
+        raise HTTPException(status_code=400, detail="没有需要生成的文档")
+    if len(item.contexts) > settings.batch_render_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"一次最多生成 {settings.batch_render_max_items} 个文档",
+        )
+    try:
+        path = templates.path_of(item.template) if item.template else settings.template
+    except KeyError:
+        raise HTTPException(status_code=404, detail="模板不存在")
+
+    main_logger.info(f"Batch rendering {len(item.contexts)} documents")
+    results = await asyncio.gather(
+        *(
+            cpu_pool.run(docx_render.render_in_worker, str(path), context)
+            for context in item.contexts
+        ),
+        return_exceptions=True,
+    )
+    contents, errors = {}, []
+    for index, result in enumerate(results, start=1):
+        if isinstance(result, Exception):
+            errors.append({"index": index, "error": str(result)})
+        else:
+            contents[f"{index:04d}.docx"] = result
+    if errors:
+        main_logger.error(f"Batch rendering failed for {len(errors)} documents")
+    if not contents:
+        raise HTTPException(status_code=500, detail=errors)
+
+    if item.output == "merged":
+        content = await cpu_pool.run(
+            docx_render.merge_documents, list(contents.values())
+        )
+        response = docx_response(content)
+        if errors:
+            response.headers["X-Render-Errors"] = json.dumps(errors)
+        return response
+    content = await asyncio.to_thread(docx_render.zip_documents, contents, errors)
+    return Response(
+        content,
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="result.zip"'},
+    )
+
+
+@router.post("/render/{name}")
+def render_template(name: str, item: dict):
+    """使用模板目录中的指定模板生成docx文件"""
+    try:
+        template = templates.get(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="模板不存在")
+    main_logger.info(f"Rendering docx template: {name}")
+    return docx_response(template.render(item))
+
+
+def get_merge_backend():
+    """合并后端的依赖，测试时可以通过 app.dependency_overrides 替换"""
+    return merge_backend
+
+
+async def save_upload(file: UploadFile, path):
+    """分块把上传的文件写入磁盘，不把整个文件读入内存"""
+    async with aiofiles.open(path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await buffer.write(chunk)
 
 
 @router.post("/mergefiles/")
-async def mergefiles(files: List[UploadFile] = File(...), fileOrder: str = Form(...)):
+async def mergefiles(
+    files: List[UploadFile] = File(...),
+    fileOrder: str = Form(...),
+    backend: RemoteMergeBackend = Depends(get_merge_backend),
+):
     main_logger.info("Starting file merge process")
     file_dir = (
         Path(__file__).resolve().parent.parent
     )  ## XXX: 不知道为什么不能修改为settings.current_dir
     # 解析文件顺序
-    fileOrder = json.loads(fileOrder)
+    try:
+        files = order_files(files, json.loads(fileOrder))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"文件顺序无效: {e}")
 
     temp_dir = str(uuid.uuid4())
+    # 同一种 PDF/DOCX 直接在进程池中合并，不经过临时目录和合并服务
+    extension = local_format(file.filename for file in files)
+    if extension is not None:
+        output = str(file_dir.joinpath(f"output/{temp_dir}{extension}"))
+        return await merge_in_process(files, extension, output)
+
     temp_path = file_dir.joinpath(temp_dir)
-    os.makedirs(temp_path, exist_ok=True)
+    await asyncio.to_thread(os.makedirs, temp_path, exist_ok=True)
+    try:
+        saved_files = []
+        for index, file in enumerate(files):
+            # 加上序号，避免同名文件互相覆盖
+            file_path = temp_path.joinpath(f"{index:03d}_{Path(file.filename).name}")
+            await save_upload(file, file_path)
+            saved_files.append(str(file_path))
+        main_logger.info(f"Saved {len(saved_files)} files for merging")
 
-    saved_files = []
+        output = str(file_dir.joinpath(f"output/{temp_dir}.pptx"))
+        result = await backend.merge(saved_files, output)
+    except MergeError as e:
+        main_logger.error(f"File merge failed with status code: {e.status_code}")
+        raise HTTPException(status_code=400, detail="合并失败")
+    except httpx.TimeoutException as e:
+        main_logger.error(f"File merge timed out: {e!r}")
+        raise HTTPException(status_code=504, detail="合并服务超时")
+    except httpx.HTTPError as e:
+        main_logger.error(f"File merge service unavailable: {e!r}")
+        raise HTTPException(status_code=502, detail="合并服务不可用")
+    finally:
+        await asyncio.to_thread(shutil.rmtree, temp_path, ignore_errors=True)
+    main_logger.info("File merge completed successfully")
+    return result
+
+
+async def merge_in_process(files: List[UploadFile], extension: str, output: str):
+    """按顺序读取同一格式的文件，在进程池中合并，结果写入 output"""
+    contents = []
     for file in files:
-        file_path = os.path.join(temp_path, file.filename)
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        saved_files.append(str(file_path))
+        content, _ = await read_upload(file)
+        contents.append(content)
+    try:
+        await cpu_pool.run(merge_local, extension, contents, output)
+    except ValueError as e:
+        main_logger.error(f"Local {extension} merge failed: {e}")
+        raise HTTPException(status_code=400, detail="合并失败")
+    main_logger.info(f"Merged {len(contents)} {extension} files in process")
+    # 与合并服务的响应格式一致，结果同样通过 /download_pptx/ 下载
+    return {"message": "success", "path": output, "files": len(contents)}
 
-    main_logger.info(f"Saved {len(saved_files)} files for merging")
 
-    url = "http://localhost:5000/Merge"
-    data = {
-        "pathList": saved_files,
-        "additionalString": str(file_dir.joinpath(f"output/{temp_dir}.pptx")),
-    }
-    response = requests.post(url, json=data)
-    if temp_path.exists():
-        shutil.rmtree(temp_path)
-    if response.status_code == 200:
-        main_logger.info("File merge completed successfully")
-        return response.json()
-    else:
-        main_logger.error(f"File merge failed with status code: {response.status_code}")
-        return HTTPException(status_code=400, detail="合并失败")
+async def read_upload(file: UploadFile, sink=None):
+    """
+    分块读取上传的文件并计算 sha256
+
+    sink 为空时返回 (文件内容, 摘要)，否则把内容写入 sink 并返回 (None, 摘要)。
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        digest.update(chunk)
+        if sink is None:
+            chunks.append(chunk)
+        else:
+            await asyncio.to_thread(sink.write, chunk)
+    return (None if sink is not None else b"".join(chunks)), digest.hexdigest()
+
+
+async def stream_zip(first, pending, batches: dict, file_name: str, compression: int):
+    """
+    把各批结果按完成顺序写入zip并逐段发送，后续失败的批次记录在 errors.json 中
+
+    客户端提前断开时取消还没有完成的批次，不再占用进程池。
+    """
+    sink = ZipStream()
+    errors = []
+    try:
+        with zipfile.ZipFile(sink, "w", compression) as zipf:
+            batch = first
+            while True:
+                for name, content in batch:
+                    await asyncio.to_thread(zipf.writestr, output_name(name, file_name), content)
+                    yield sink.drain()
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                batch = []
+                for task in done:
+                    try:
+                        batch.extend(task.result())
+                    except Exception as e:
+                        main_logger.error(f"Error during PDF watermarking: {e}")
+                        errors.append({"names": batches[task], "error": str(e)})
+            if errors:
+                zipf.writestr("errors.json", json.dumps(errors, ensure_ascii=False, indent=2))
+        yield sink.drain()
+    finally:
+        unfinished = [task for task in pending if not task.done()]
+        if unfinished:
+            main_logger.info(
+                f"PDF watermark stream closed early, cancelling {len(unfinished)} batches"
+            )
+            for task in unfinished:
+                task.cancel()
 
 
 @router.post("/pdfmarks/")
-async def pdfmarks(files: UploadFile = File(...), fileOrder: str = Form(...)):
-    main_logger.info("Starting PDF watermarking process")
-    # 获取original文件夹的路径
-    original_dir = Path(__file__).parent.parent / "handler" / "original"
+async def pdfmarks(
+    files: UploadFile = File(...),
+    fileOrder: str = Form(...),
+    stream: bool = Form(False),
+    compression: Literal["stored", "deflated"] = Form("stored"),
+):
+    """
+    为每个接收人生成加了水印的PDF并打包
 
-    # 获取文件
-    file_name = files.filename
-    file_path = os.path.join(original_dir, file_name)
+    fileOrder 为逗号分隔的接收人姓名。接收人分批在进程池中并行处理。
+    stream 为 true 时直接在响应中返回压缩包，每批完成后立即写入并发送；
+    否则返回压缩包在服务器上的路径，压缩包保留 PDFMARKS_ZIP_TTL_SECONDS 秒。
+    compression 选择压缩包的压缩方式：stored 只存储，deflated 压缩。
+    """
+    main_logger.info("Starting PDF watermarking process")
+    file_name = Path(files.filename).name
+    names = parse_names(fileOrder)
+    if not names:
+        raise HTTPException(status_code=400, detail="没有水印接收人")
+    source, digest = await read_upload(files)
+    main_logger.info(f"Received {file_name} for {len(names)} recipients")
 
-    # 保存上传的文件
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(files.file, buffer)
-    main_logger.info(f"Saved uploaded file: {file_path}")
+    stamp = time_mark()
+    cached = await asyncio.to_thread(cached_results, result_cache, digest, names, stamp)
+    missing = [name for name in names if name not in cached]
+    main_logger.info(f"{len(cached)} recipients served from cache, {len(missing)} to render")
 
-    # 获取姓名列表
-    name_list = fileOrder
+    async def render(batch):
+        results = await cpu_pool.run(watermark_batch, source, batch, stamp)
+        await asyncio.to_thread(store_results, result_cache, digest, stamp, results)
+        return results
 
-    # 调用pdf_marks函数批量添加水印
+    # 任务 -> 该批的接收人
+    tasks = {
+        asyncio.ensure_future(render(batch)): batch
+        for batch in (split_batches(missing, cpu_pool.size) if missing else [])
+    }
     try:
-        zip_path = pdf_marks(file_path, file_name, name_list)
+        if stream:
+            if cached:
+                first, pending = list(cached.items()), set(tasks)
+            else:
+                # 等到第一批完成再开始响应，整体失败时仍能返回错误状态码
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                task = done.pop()
+                first, pending = task.result(), pending | done
+            return StreamingResponse(
+                stream_zip(first, pending, tasks, file_name, ZIP_COMPRESSIONS[compression]),
+                media_type="application/zip",
+                headers={
+                    "Content-Disposition": "attachment; filename*=UTF-8''"
+                    + quote(f"{Path(file_name).stem}.zip")
+                },
+            )
+
+        for batch in await asyncio.gather(*tasks):
+            cached.update(batch)
+        await asyncio.to_thread(cleanup_zips, settings.pdfmarks_zip_ttl_seconds)
+        zip_path = ZIP_DIR / str(uuid.uuid4()) / f"{Path(file_name).stem}.zip"
+        await asyncio.to_thread(
+            write_zip,
+            zip_path,
+            file_name,
+            ((name, cached[name]) for name in names),
+            ZIP_COMPRESSIONS[compression],
+        )
         main_logger.info(f"PDF watermarking completed. Zip file created: {zip_path}")
-        return {"message": "success", "path": zip_path}
+        return {"message": "success", "path": str(zip_path)}
     except Exception as e:
+        for task in tasks:
+            task.cancel()
         # 返回错误响应
         main_logger.error(f"Error during PDF watermarking: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {e}")
 
 
+def _get_pdfmarks_job(job_id: str):
+    try:
+        return get_job(settings.pdfmarks_job_directory, job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+
+def _pdfmarks_job_finished(job, future):
+    """工作进程异常退出或任务被丢弃时，任务状态不会由工作进程更新，在这里标记为失败"""
+    if future.cancelled():
+        error = "服务关闭，任务未执行"
+    else:
+        error = future.exception()
+    if error is None:
+        return
+    main_logger.error(f"PDF watermarking job {job.id} aborted: {error}")
+    try:
+        if job.read()["status"] not in FINISHED:
+            job.update(status=FAILED, error=str(error), finished=time.time())
+    except OSError:
+        pass
+
+
+@router.post("/pdfmarks/jobs/", status_code=202)
+async def create_pdfmarks_job(
+    files: UploadFile = File(...),
+    fileOrder: str = Form(...),
+    compression: Literal["stored", "deflated"] = Form("stored"),
+    low_memory: Optional[bool] = Form(None),
+):
+    """
+    创建PDF水印后台任务，立即返回任务状态
+
+    任务在进程池中执行，同时执行的任务数由 PDFMARKS_MAX_JOBS 控制，超出的任务排队等待。
+    通过 /pdfmarks/jobs/{id} 查询进度，或通过 /pdfmarks/jobs/{id}/events 接收进度推送。
+    low_memory 不传时，源文件不小于 PDFMARKS_LOW_MEMORY_MIN_BYTES 则使用低内存模式。
+    """
+    file_name = Path(files.filename).name
+    names = parse_names(fileOrder)
+    if not names:
+        raise HTTPException(status_code=400, detail="没有水印接收人")
+    root = settings.pdfmarks_job_directory
+    await asyncio.to_thread(cleanup_jobs, root, settings.pdfmarks_zip_ttl_seconds)
+    job = await asyncio.to_thread(
+        create_job,
+        root,
+        file_name,
+        names,
+        time_mark(),
+        ZIP_COMPRESSIONS[compression],
+        low_memory,
+    )
+    with open(job.source_path, "wb") as buffer:
+        _, digest = await read_upload(files, buffer)
+    await asyncio.to_thread(job.update, digest=digest)
+    future = job_pool.submit(
+        run_job,
+        str(job.path),
+        settings.pdfmarks_progress_interval,
+        str(settings.pdfmarks_cache_directory),
+        settings.pdfmarks_cache_max_bytes,
+        settings.pdfmarks_low_memory_min_bytes,
+    )
+    future.add_done_callback(partial(_pdfmarks_job_finished, job))
+    main_logger.info(f"Created PDF watermarking job {job.id} for {len(names)} recipients")
+    return await asyncio.to_thread(job.read)
+
+
+@router.get("/pdfmarks/jobs/{job_id}")
+def read_pdfmarks_job(job_id: str):
+    """查询任务状态和进度"""
+    return _get_pdfmarks_job(job_id).read()
+
+
+@router.get("/pdfmarks/jobs/{job_id}/events")
+async def pdfmarks_job_events(job_id: str, request: Request):
+    """
+    以 Server-Sent Events 推送任务进度
+
+    状态变化时发送 progress 事件，任务结束时发送与最终状态同名的事件
+    （done、failed 或 cancelled）后关闭连接。
+    """
+    job = _get_pdfmarks_job(job_id)
+
+    async def events():
+        updated = None
+        while not await request.is_disconnected():
+            try:
+                state = await asyncio.to_thread(job.read)
+            except OSError:
+                break
+            finished = state["status"] in FINISHED
+            if state["updated"] != updated or finished:
+                updated = state["updated"]
+                event = state["status"] if finished else "progress"
+                yield f"event: {event}\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+            if finished:
+                break
+            await asyncio.sleep(settings.pdfmarks_events_interval)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/pdfmarks/jobs/{job_id}/result")
+def download_pdfmarks_job(job_id: str):
+    """下载已完成任务的压缩包"""
+    job = _get_pdfmarks_job(job_id)
+    state = job.read()
+    if state["status"] != DONE:
+        raise HTTPException(status_code=409, detail="任务尚未完成")
+    return FileResponse(
+        job.result_path,
+        media_type="application/zip",
+        filename=f"{Path(state['file_name']).stem}.zip",
+    )
+
+
+@router.delete("/pdfmarks/jobs/{job_id}")
+def cancel_pdfmarks_job(job_id: str):
+    """取消排队或执行中的任务，执行中的任务在处理下一页之前停止"""
+    job = _get_pdfmarks_job(job_id)
+    state = job.read()
+    if state["status"] in FINISHED:
+        return state
+    job.request_cancel()
+    if state["status"] == QUEUED:
+        state = job.update(status=CANCELLED, finished=time.time())
+    main_logger.info(f"Cancelling PDF watermarking job {job.id}")
+    return state
+
+
 @router.get("/download_pptx/")
 async def download_pptx(file_path: str = Query(..., description="PPTX文件的绝对路径")):
     main_logger.info(f"Attempting to download PPTX file: {file_path}")
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="文件不存在")
     main_logger.info(f"Serving PPTX file: {file_path}")
+    # 本地合并的 PDF/DOCX 结果也从这里下载
+    local = LOCAL_MERGERS.get(Path(file_path).suffix.lower())
     return FileResponse(
         file_path,
-        media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+        media_type=local[1] if local else PPTX_MEDIA_TYPE,
         filename=os.path.basename(file_path),
     )
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.dependencies import get_current_active_user, get_db
+from fastapi import APIRouter, Depends, HTTPException, Response
+from app.dependencies import get_current_active_user, get_read_db
 
-from sqlalchemy.orm import Session
-from app.sql_app import crud, schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.sql_app import async_crud, crud, schemas
 
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 
 router = APIRouter(tags=["用户相关"])
 
@@ -20,9 +20,9 @@ async def read_users_me(
 
 
 @router.get("/current_users/long_info", response_model=schemas.User)
-def read_user(
+async def read_user(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     读取单个用户信息
@@ -31,7 +31,7 @@ def read_user(
 
     参数:
     - user_id (int): 用户ID。
-    - db (Session): 数据库会话对象，由FastAPI的依赖注入系统提供。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
 
     返回:
     - schemas.User: 返回指定用户的信息，包括balance、total_positive_amount、total_handled_negative_amount、total_unhandled_negative_amount。
@@ -40,26 +40,49 @@ def read_user(
     异常:
     - HTTPException: 如果用户不存在，则抛出状态码为404的HTTP异常。
     """
-    db_user = crud.get_user(db, user_id=current_user.id)
+    db_user = await async_crud.get_user(db, user_id=current_user.id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
 @router.get("/users/all_info", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    include_bills: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+):
     """
     读取用户列表
 
-    此函数用于从数据库中读取用户列表。
+    此函数用于从数据库中读取用户列表，按用户ID排序，每个用户都带有余额等汇总信息。
 
     参数:
-    - skip (int): 跳过前多少个用户，默认为0。
+    - skip (int): 跳过前多少个用户，默认为0。传入cursor时忽略。
     - limit (int): 限制返回的用户数量，默认为100。
-    - db (Session): 数据库会话对象，由FastAPI的依赖注入系统提供。
+    - cursor (str): 上一页响应头 X-Next-Cursor 中的游标，传入后按游标翻页，每页耗时不随页数增加。
+    - include_bills (bool): 是否返回每个用户的账单，默认为False，此时 bills 为空列表。
+    - db (AsyncSession): 数据库会话对象，由FastAPI的依赖注入系统提供。
 
     返回:
-    - List[schemas.User]: 返回用户列表。
+    - List[schemas.User]: 返回用户列表。还有下一页时，响应头 X-Next-Cursor 中带有下一页的游标。
+
+    异常:
+    - HTTPException: 如果游标无效，则抛出状态码为400的HTTP异常。
     """
-    users = crud.get_users(db, skip=skip, limit=limit)
+    after_id = None
+    if cursor is not None:
+        try:
+            after_id = crud.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    users = await async_crud.get_users(
+        db, skip=skip, limit=limit, after_id=after_id, include_bills=include_bills
+    )
+    cursor = crud.next_cursor(users, limit)
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = cursor
     return users
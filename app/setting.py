@@ -1,12 +1,70 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
     db_url: str
+    # 异步引擎地址，不填时根据 db_url 使用 aiosqlite 驱动
+    async_db_url: Optional[str] = None
+    # SQLite 连接参数，每个连接建立时通过 PRAGMA 设置
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000  # 负数表示以KiB为单位，即约64MB
+    # 只读连接池大小，写连接池固定为一个连接
+    db_read_pool_size: int = 8
+    db_read_max_overflow: int = 4
+    # 等待连接池空闲连接的超时时间（秒）
+    db_pool_timeout: int = 30
+    # 批量导入账单时每批插入并提交的数量，以及错误报告最多保留的条数
+    bulk_import_batch_size: int = 1000
+    bulk_import_max_errors: int = 1000
+    # 导出账单时每批从数据库读取的行数
+    export_batch_size: int = 1000
+    # 已认证用户的缓存时间（秒）和最多缓存的用户数，缓存时间为0时不缓存
+    user_cache_ttl_seconds: int = 60
+    user_cache_maxsize: int = 1024
+    # CPU密集型任务进程池的进程数（默认为CPU核数）和同时执行的任务上限
+    cpu_pool_workers: Optional[int] = None
+    cpu_pool_max_concurrency: Optional[int] = None
+    # 批量生成docx时一次请求最多包含的文档数量
+    batch_render_max_items: int = 500
+    # /pdfmarks/ 生成的压缩包在服务器上保留的时间（秒）
+    pdfmarks_zip_ttl_seconds: int = 24 * 3600
+    # PDF 水印后台任务的目录、同时执行的任务数、状态文件的更新间隔（秒）和推送进度的检查间隔（秒）
+    # 多个服务进程需要共用同一个任务目录，任务及结果保留 pdfmarks_zip_ttl_seconds 秒
+    pdfmarks_job_dir: str = "jobs"
+    pdfmarks_max_jobs: int = 2
+    pdfmarks_progress_interval: float = 0.5
+    pdfmarks_events_interval: float = 0.5
+    # PDF 水印结果缓存的目录和总大小上限（字节），超出后淘汰最久未使用的结果，为0时不缓存
+    pdfmarks_cache_dir: str = "cache/pdfmarks"
+    pdfmarks_cache_max_bytes: int = 512 * 1024 * 1024
+    # 后台任务的源文件不小于该大小（字节）时使用低内存模式，为0时只在请求指定时使用
+    pdfmarks_low_memory_min_bytes: int = 64 * 1024 * 1024
+    # 外部文件合并服务的地址、请求超时（秒）、建立连接超时（秒）、等待空闲连接超时（秒）、
+    # 建立连接失败时的重试次数，以及同时连接合并服务的最大连接数
+    merge_service_url: str = "http://localhost:5000/Merge"
+    merge_timeout: float = 300.0
+    merge_connect_timeout: float = 5.0
+    merge_pool_timeout: float = 30.0
+    merge_retries: int = 2
+    merge_max_connections: int = 10
+    # Admin页面用户详情中显示的最近账单数量
+    admin_bill_panel_size: int = 20
+    # bcrypt 密码哈希与校验使用的工作池类型（thread 或 process）、工作线程/进程数和同时执行的任务上限
+    password_hash_executor: str = "thread"
+    password_hash_workers: int = 2
+    password_hash_max_concurrency: int = 4
     template_path: str
     config_path: str
+    # 检查参考资料配置文件是否修改的最小间隔（秒）
+    reference_check_interval: float = 1.0
+    # 具名docx模板所在目录，以及最多缓存的已解析模板数量
+    template_dir: str = "assets/templates"
+    template_cache_size: int = 16
     # 获取当前文件的目录
     admin_secret_key: str
     allowed_origins: str
@@ -29,6 +87,18 @@ class Settings(BaseSettings):
     def template(self) -> List[str]:
         return self.current_dir.joinpath(self.template_path)
 
+    @property
+    def template_directory(self) -> Path:
+        return self.current_dir.joinpath(self.template_dir)
+
+    @property
+    def pdfmarks_job_directory(self) -> Path:
+        return self.current_dir.joinpath(self.pdfmarks_job_dir)
+
+    @property
+    def pdfmarks_cache_directory(self) -> Path:
+        return self.current_dir.joinpath(self.pdfmarks_cache_dir)
+
     @property
     def config(self) -> List[str]:
         return self.current_dir.joinpath(self.config_path)
@@ -1,9 +1,22 @@
 from sqladmin import ModelView
 from sqladmin.authentication import AuthenticationBackend
-from app.sql_app import crud
+from app.sql_app import async_crud, crud
 from app.sql_app.models import User, Bill
 from fastapi import Request
-from app.sql_app.database import SessionLocal
+from app.sql_app.database import AsyncReadSessionLocal, SessionLocal
+from app.dependencies import invalidate_user_cache
+import anyio
+
+
+def refresh_balances(*user_ids):
+    """Admin页面直接修改账单后，按账单表刷新相关用户的汇总"""
+    db = SessionLocal()
+    try:
+        for user_id in set(user_ids):
+            if user_id is not None:
+                crud.refresh_user_balance(db, user_id)
+    finally:
+        db.close()
 
 
 class UserAdmin(ModelView, model=User):
@@ -36,6 +49,26 @@ class UserAdmin(ModelView, model=User):
     }
     can_export = False
 
+    async def get_detail_value(self, obj, prop):
+        if prop == "bill_info":
+            # 账单面板需要查询数据库，在线程中生成，避免阻塞事件循环
+            value = await anyio.to_thread.run_sync(lambda: obj.bill_info)
+            return value, value
+        return await super().get_detail_value(obj, prop)
+
+    async def on_model_change(self, data, model, is_created, request):
+        # 记录修改前的用户名，改名后旧用户名对应的缓存也要清除
+        request.state.user_name = model.name
+
+    async def after_model_change(self, data, model, is_created, request):
+        invalidate_user_cache(request.state.user_name, model.name)
+
+    async def on_model_delete(self, model, request):
+        request.state.user_name = model.name
+
+    async def after_model_delete(self, model, request):
+        invalidate_user_cache(request.state.user_name)
+
 
 class BillAdmin(ModelView, model=Bill):
     """
@@ -70,21 +103,37 @@ class BillAdmin(ModelView, model=Bill):
         "user_info": "用户",
     }
 
+    async def on_model_change(self, data, model, is_created, request):
+        # 记录修改前的所属用户，账单转给其他用户时两边的汇总都要刷新
+        request.state.bill_user_id = model.user_id
+
+    async def after_model_change(self, data, model, is_created, request):
+        await anyio.to_thread.run_sync(
+            refresh_balances, request.state.bill_user_id, model.user_id
+        )
+
+    async def on_model_delete(self, model, request):
+        request.state.bill_user_id = model.user_id
+
+    async def after_model_delete(self, model, request):
+        await anyio.to_thread.run_sync(refresh_balances, request.state.bill_user_id)
+
 
 class AdminAuth(AuthenticationBackend):
     """
     用于在Admin页面中引入认证机制
     """
     async def login(self, request: Request) -> bool:
-        db = SessionLocal()
         form = await request.form()
         username, password = form["username"], form["password"]
-        result = crud.authenticate_user(db=db, name=username, hashed_password=password)
+        # 与 /token 相同，只读连接上校验密码，不占用唯一的写连接
+        async with AsyncReadSessionLocal() as db:
+            result = await async_crud.authenticate_user(
+                db=db, name=username, hashed_password=password
+            )
         if not result["status"]:
-            db.close()
             return False
         request.session.update({"token": "youcanuseit"})
-        db.close()
         return True
 
     async def logout(self, request: Request) -> bool:
@@ -0,0 +1,163 @@
+"""
+crud 的异步版本
+
+每个函数通过 AsyncSession.run_sync 在异步连接上执行 crud 中对应的同步实现，
+数据库 IO 由 aiosqlite 在后台线程完成，不会阻塞事件循环，两套接口共用同一份
+业务逻辑（例如账单汇总的增量维护）。bcrypt 密码哈希与校验耗时较长，
+不放在 run_sync 中执行，而是交给 password_pool 工作池。
+
+路由在 run_sync 之外序列化结果时不能再触发懒加载，因此会被序列化的关系
+（例如 User.bills）需要在这里提前加载。
+"""
+from datetime import datetime
+
+import anyio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, models, schemas
+from ..workers import password_pool
+
+
+def _load_bills(*users):
+    """在同步上下文中提前加载用户的账单"""
+    for user in users:
+        if user is not None:
+            user.bills
+    return users
+
+
+async def authenticate_user(db: AsyncSession, name: str, hashed_password: str = None):
+    user = await get_user_by_name(db, name)
+    password_valid = (
+        user is None
+        or hashed_password is None
+        or await password_pool.run(
+            crud.verify_password, hashed_password, user.hashed_password
+        )
+    )
+    return crud.check_user(user, password_valid)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    password_hash = await password_pool.run(
+        crud.get_password_hash, user.hashed_password
+    )
+
+    def _create_user(session):
+        db_user = crud.create_user(session, user, password_hash)
+        _load_bills(db_user)
+        return db_user
+
+    return await db.run_sync(_create_user)
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    def _get_user(session):
+        db_user = crud.get_user(session, user_id)
+        _load_bills(db_user)
+        return db_user
+
+    return await db.run_sync(_get_user)
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.run_sync(crud.get_user_by_email, email)
+
+
+async def get_user_by_name(db: AsyncSession, name: str):
+    return await db.run_sync(crud.get_user_by_name, name)
+
+
+async def get_users(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int = None,
+    include_bills: bool = False,
+):
+    # 账单由 crud.get_users 按 include_bills 预先加载或跳过，这里无需再加载
+    return await db.run_sync(crud.get_users, skip, limit, after_id, include_bills)
+
+
+async def create_bill(db: AsyncSession, bill: schemas.BillCreate, user_id: int):
+    return await db.run_sync(crud.create_bill, bill, user_id)
+
+
+async def import_bills(
+    db: AsyncSession,
+    rows,
+    user_id: int,
+    batch_size: int = 1000,
+    max_errors: int = 1000,
+):
+    """
+    批量导入账单
+
+    读取、解析和校验在线程池中按批进行，事件循环和写连接只在每批的
+    executemany 期间占用，导入大文件时不会阻塞其他请求的读写。
+    """
+    result = crud.new_import_result()
+    rows = iter(rows)
+    while batch := await anyio.to_thread.run_sync(
+        crud.next_import_batch, rows, user_id, result, batch_size, max_errors
+    ):
+        result["imported"] += await db.run_sync(crud.insert_bill_batch, batch, user_id)
+    return result
+
+
+async def get_bills(
+    db: AsyncSession, skip: int = 0, limit: int = 100, after_id: int = None
+):
+    return await db.run_sync(crud.get_bills, skip, limit, after_id)
+
+
+async def get_bill(db: AsyncSession, bill_id: int):
+    return await db.run_sync(crud.get_bill, bill_id)
+
+
+async def update_bill(db: AsyncSession, bill_id: int, bill: schemas.BillUpdate):
+    return await db.run_sync(crud.update_bill, bill_id, bill)
+
+
+async def delete_bill(db: AsyncSession, bill_id: int):
+    return await db.run_sync(crud.delete_bill, bill_id)
+
+
+async def get_user_bills(db: AsyncSession, user_id: int, month: int, year: int = None):
+    return await db.run_sync(crud.get_user_bills, user_id, month, year)
+
+
+async def get_user_report(
+    db: AsyncSession, user_id: int, year: int, granularity: str = "month"
+):
+    return await db.run_sync(crud.get_user_report, user_id, year, granularity)
+
+
+async def stream_user_bills(
+    db: AsyncSession,
+    user_id: int,
+    start: datetime = None,
+    end: datetime = None,
+    batch_size: int = 1000,
+):
+    """
+    按日期顺序分批产出用户的账单，日期范围为 [start, end)
+
+    直接在异步连接上使用服务端游标逐批读取列值元组，不创建ORM对象，
+    内存占用只与 batch_size 有关。
+    """
+    bill = models.Bill
+    stmt = (
+        select(bill.id, bill.bill_date, bill.summary, bill.amount, bill.handle)
+        .where(bill.user_id == user_id)
+        .order_by(bill.bill_date, bill.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if start is not None:
+        stmt = stmt.where(bill.bill_date >= start)
+    if end is not None:
+        stmt = stmt.where(bill.bill_date < end)
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        yield rows
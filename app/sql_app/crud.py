@@ -1,8 +1,11 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import extract
+from sqlalchemy.orm import Session, noload, selectinload
+from pydantic import ValidationError
+from sqlalchemy import case, func, insert
+import base64
+import json
 import jwt
 from . import models, schemas
-from typing import Union
+from typing import Iterable, Iterator, Union
 from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from ..setting import settings
@@ -14,6 +17,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# 用户账单汇总中需要维护的字段
+BALANCE_FIELDS = (
+    "total_positive_amount",
+    "total_handled_negative_amount",
+    "total_unhandled_negative_amount",
+    "balance",
+    "bill_count",
+)
+# 校验汇总时允许的浮点误差
+BALANCE_TOLERANCE = 1e-6
+
 
 def verify_password(plain_password, hashed_password):
     """验证密码"""
@@ -36,27 +50,41 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
     return encoded_jwt
 
 
-def authenticate_user(db: Session, name: str, hashed_password: str = None):
-    user = db.query(models.User).filter(models.User.name == name).first()
+def check_user(user: models.User, password_valid: bool = True):
+    """根据查询到的用户和密码校验结果生成认证结果"""
     if not user:
         return {"status": False, "message": "用户不存在"}
-    if hashed_password is not None:
-        if not verify_password(hashed_password, user.hashed_password):
-            return {"status": False, "message": "密码错误"}
+    if not password_valid:
+        return {"status": False, "message": "密码错误"}
     if not user.is_active:
         return {"status": False, "message": "用户未激活"}
     return {"status": True, "message": "登录成功", "user": user}
 
 
-def create_user(db: Session, user: schemas.UserCreate):
+def authenticate_user(db: Session, name: str, hashed_password: str = None):
+    user = get_user_by_name(db, name)
+    password_valid = (
+        user is None
+        or hashed_password is None
+        or verify_password(hashed_password, user.hashed_password)
+    )
+    return check_user(user, password_valid)
+
+
+def create_user(db: Session, user: schemas.UserCreate, password_hash: str = None):
+    """创建用户，password_hash 为已经计算好的密码哈希，不传时在这里计算"""
+    if password_hash is None:
+        password_hash = get_password_hash(user.hashed_password)
     db_user = models.User(
         name=user.name,
         nickname=user.nickname,
         email=user.email,
-        hashed_password=get_password_hash(user.hashed_password),  # 使用哈希后的密码
+        hashed_password=password_hash,  # 使用哈希后的密码
         is_active=user.is_active,
     )
     db.add(db_user)
+    db.flush()
+    db.add(models.UserBalance(user_id=db_user.id, **_empty_balance()))
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -65,21 +93,9 @@ def create_user(db: Session, user: schemas.UserCreate):
 def get_user(db: Session, user_id: int):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if user:
-        bills = user.bills
-        user.total_positive_amount = sum(
-            bill.amount for bill in bills if bill.amount > 0
-        )
-        user.total_handled_negative_amount = sum(
-            bill.amount for bill in bills if bill.amount < 0 and bill.handle
-        )
-        user.total_unhandled_negative_amount = sum(
-            bill.amount for bill in bills if bill.amount < 0 and not bill.handle
-        )
-        user.balance = (
-            user.total_positive_amount
-            + user.total_handled_negative_amount
-            + user.total_unhandled_negative_amount
-        )
+        summary = get_user_balance(db, user_id)
+        for field in BALANCE_FIELDS:
+            setattr(user, field, getattr(summary, field))
     return user
 
 
@@ -87,22 +103,149 @@ def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_user_by_name(db: Session, name: str):
+    return db.query(models.User).filter(models.User.name == name).first()
+
+
+def encode_cursor(last_id: int):
+    """把上一页最后一条记录的ID编码为不透明的游标"""
+    raw = json.dumps({"id": last_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """解析游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_id = json.loads(raw)["id"]
+    except Exception:
+        raise ValueError("无效的游标")
+    if not isinstance(last_id, int):
+        raise ValueError("无效的游标")
+    return last_id
+
+
+def next_cursor(items: list, limit: int):
+    """本页已取满时返回下一页的游标，否则说明没有下一页"""
+    if limit > 0 and len(items) == limit:
+        return encode_cursor(items[-1].id)
+    return None
+
+
+def _paginate(query, id_column, skip: int, limit: int, after_id: int = None):
+    """按主键排序分页，传入 after_id 时使用游标分页，否则使用 offset 分页"""
+    query = query.order_by(id_column)
+    if after_id is not None:
+        return query.filter(id_column > after_id).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+
+
+def get_users(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int = None,
+    include_bills: bool = False,
+):
+    """
+    分页读取用户及其账单汇总
+
+    用户与汇总表在同一条查询中关联读取；没有汇总记录的旧用户再用一次
+    GROUP BY 聚合补算。include_bills 为 True 时用一次 selectinload 加载本页
+    所有用户的账单，否则不加载账单。
+    """
+    query = db.query(models.User, models.UserBalance).outerjoin(
+        models.UserBalance, models.UserBalance.user_id == models.User.id
+    )
+    if include_bills:
+        query = query.options(selectinload(models.User.bills))
+    else:
+        query = query.options(noload(models.User.bills))
+    rows = _paginate(query, models.User.id, skip, limit, after_id)
+
+    missing = [user.id for user, summary in rows if summary is None]
+    computed = _compute_user_balances(db, missing) if missing else {}
+    users = []
+    for user, summary in rows:
+        if summary is None:
+            values = computed.get(user.id, _empty_balance())
+        else:
+            values = {field: getattr(summary, field) for field in BALANCE_FIELDS}
+        for field, value in values.items():
+            setattr(user, field, value)
+        users.append(user)
+    return users
 
 
 def create_bill(db: Session, bill: schemas.BillCreate, user_id: int):
     db_bill = models.Bill(**bill.model_dump())
     db_bill.user_id = user_id
     db_bill.bill_date = datetime.strptime(bill.bill_date, "%Y-%m-%d %H:%M:%S")
+    _apply_balance_delta(db, user_id, _bill_delta(db_bill.amount, db_bill.handle))
     db.add(db_bill)
     db.commit()
     db.refresh(db_bill)
     return db_bill
 
 
-def get_bills(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Bill).offset(skip).limit(limit).all()
+def _format_import_error(error: Exception):
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(loc) for loc in item['loc'])}: {item['msg']}"
+            for item in error.errors()
+        )
+    return str(error)
+
+
+def insert_bill_batch(db: Session, batch: list, user_id: int):
+    """用 executemany 插入一批账单，并在同一事务内更新用户汇总"""
+    delta = _empty_balance()
+    for values in batch:
+        for field, value in _bill_delta(values["amount"], values["handle"]).items():
+            delta[field] += value
+    _apply_balance_delta(db, user_id, delta)
+    db.execute(insert(models.Bill), batch)
+    db.commit()
+    return len(batch)
+
+
+def new_import_result():
+    return {"imported": 0, "failed": 0, "errors": [], "errors_truncated": False}
+
+
+def next_import_batch(
+    rows: Iterator, user_id: int, result: dict, batch_size: int = 1000, max_errors: int = 1000
+):
+    """
+    从 rows 中读取并校验账单，直到凑满 batch_size 条或读完为止
+
+    不访问数据库，可以在线程池中执行。校验失败的行记录到 result 中，
+    最多保留 max_errors 条错误明细；返回可以直接插入的账单列表，读完时为空列表。
+    """
+    batch = []
+    for line, raw in rows:
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            bill = schemas.BillCreate.model_validate(raw)
+            values = bill.model_dump()
+            values["user_id"] = user_id
+            values["bill_date"] = datetime.strptime(bill.bill_date, "%Y-%m-%d %H:%M:%S")
+        except ValueError as e:
+            result["failed"] += 1
+            if len(result["errors"]) < max_errors:
+                result["errors"].append({"line": line, "error": _format_import_error(e)})
+            else:
+                result["errors_truncated"] = True
+            continue
+        batch.append(values)
+        if len(batch) >= batch_size:
+            break
+    return batch
+
+
+def get_bills(db: Session, skip: int = 0, limit: int = 100, after_id: int = None):
+    return _paginate(db.query(models.Bill), models.Bill.id, skip, limit, after_id)
 
 
 def get_bill(db: Session, bill_id: int):
@@ -112,6 +255,7 @@ def get_bill(db: Session, bill_id: int):
 def update_bill(db: Session, bill_id: int, bill: schemas.BillUpdate):
     db_bill = db.query(models.Bill).filter(models.Bill.id == bill_id).first()
     if db_bill:
+        old_delta = _bill_delta(db_bill.amount, db_bill.handle, sign=-1)
         update_data = bill.model_dump(exclude_unset=True)
         if "bill_date" in update_data:
             update_data["bill_date"] = datetime.strptime(
@@ -119,6 +263,12 @@ def update_bill(db: Session, bill_id: int, bill: schemas.BillUpdate):
             )
         for key, value in update_data.items():
             setattr(db_bill, key, value)
+        new_delta = _bill_delta(db_bill.amount, db_bill.handle)
+        _apply_balance_delta(
+            db,
+            db_bill.user_id,
+            {key: old_delta[key] + new_delta[key] for key in BALANCE_FIELDS},
+        )
         db.commit()
         db.refresh(db_bill)
     return db_bill
@@ -127,17 +277,211 @@ def update_bill(db: Session, bill_id: int, bill: schemas.BillUpdate):
 def delete_bill(db: Session, bill_id: int):
     db_bill = db.query(models.Bill).filter(models.Bill.id == bill_id).first()
     if db_bill:
+        _apply_balance_delta(
+            db, db_bill.user_id, _bill_delta(db_bill.amount, db_bill.handle, sign=-1)
+        )
         db.delete(db_bill)
         db.commit()
     return db_bill
 
 
-def get_user_bills(db: Session, user_id: int, month: int):
+def month_range(year: int, month: int):
+    """返回某月的半开区间 [当月第一天, 下月第一天)"""
+    start = datetime(year, month, 1)
+    if month == 12:
+        end = datetime(year + 1, 1, 1)
+    else:
+        end = datetime(year, month + 1, 1)
+    return start, end
+
+
+# 报表统计粒度对应的 strftime 格式
+REPORT_PERIOD_FORMATS = {"month": "%Y-%m", "day": "%Y-%m-%d"}
+
+
+def get_user_report(db: Session, user_id: int, year: int, granularity: str = "month"):
+    """用一条 GROUP BY 查询统计用户某一年每月（或每天）的收支"""
+    amount = models.Bill.amount
+    handled = models.Bill.handle.is_(True)
+    period = func.strftime(REPORT_PERIOD_FORMATS[granularity], models.Bill.bill_date)
+    start, _ = month_range(year, 1)
+    _, end = month_range(year, 12)
+    rows = (
+        db.query(
+            period.label("period"),
+            func.sum(case((amount > 0, amount), else_=0)),
+            func.sum(case(((amount < 0) & handled, amount), else_=0)),
+            func.sum(case(((amount < 0) & ~handled, amount), else_=0)),
+            func.sum(amount),
+            func.count(),
+        )
+        .filter(
+            models.Bill.user_id == user_id,
+            models.Bill.bill_date >= start,
+            models.Bill.bill_date < end,
+        )
+        .group_by(period)
+        .order_by(period)
+        .all()
+    )
+    return [
+        {
+            "period": row[0],
+            "income": row[1] or 0,
+            "handled_expense": row[2] or 0,
+            "unhandled_expense": row[3] or 0,
+            "net": row[4] or 0,
+            "bill_count": row[5],
+        }
+        for row in rows
+    ]
+
+
+def get_user_bills(db: Session, user_id: int, month: int, year: int = None):
+    if year is None:
+        year = datetime.now().year
+    start, end = month_range(year, month)
+    # 使用日期范围而不是 extract，才能走 (user_id, bill_date) 索引
     return (
         db.query(models.Bill)
         .filter(
             models.Bill.user_id == user_id,
-            extract("month", models.Bill.bill_date) == month,
+            models.Bill.bill_date >= start,
+            models.Bill.bill_date < end,
         )
+        .order_by(models.Bill.bill_date, models.Bill.id)
         .all()
     )
+
+
+def _empty_balance():
+    return {field: 0 for field in BALANCE_FIELDS}
+
+
+def _bill_delta(amount: float, handle: bool, sign: int = 1):
+    """计算单条账单对用户汇总的影响，sign为-1时表示撤销该账单"""
+    delta = _empty_balance()
+    amount = amount or 0
+    if amount > 0:
+        delta["total_positive_amount"] = sign * amount
+    elif amount < 0 and handle:
+        delta["total_handled_negative_amount"] = sign * amount
+    elif amount < 0:
+        delta["total_unhandled_negative_amount"] = sign * amount
+    delta["balance"] = sign * amount
+    delta["bill_count"] = sign
+    return delta
+
+
+def _balance_aggregate(db: Session):
+    """按用户聚合账单，返回 (user_id, 收入, 已结算支出, 支出合计, 余额, 数量) 的查询"""
+    amount = models.Bill.amount
+    return db.query(
+        models.Bill.user_id,
+        func.coalesce(func.sum(case((amount > 0, amount), else_=0)), 0),
+        func.coalesce(
+            func.sum(case(((amount < 0) & models.Bill.handle.is_(True), amount), else_=0)),
+            0,
+        ),
+        func.coalesce(func.sum(case((amount < 0, amount), else_=0)), 0),
+        func.coalesce(func.sum(amount), 0),
+        func.count(models.Bill.id),
+    ).group_by(models.Bill.user_id)
+
+
+def _balance_from_row(row):
+    _, positive, handled, negative, balance, count = row
+    return {
+        "total_positive_amount": positive,
+        "total_handled_negative_amount": handled,
+        "total_unhandled_negative_amount": negative - handled,
+        "balance": balance,
+        "bill_count": count,
+    }
+
+
+def _compute_user_balances(db: Session, user_ids: Iterable = None):
+    """根据账单表重新计算用户汇总，返回 {user_id: 汇总}"""
+    query = _balance_aggregate(db)
+    if user_ids is not None:
+        query = query.filter(models.Bill.user_id.in_(user_ids))
+    return {row[0]: _balance_from_row(row) for row in query.all()}
+
+
+def get_user_balance(db: Session, user_id: int):
+    """获取用户账单汇总，旧数据没有汇总记录时按账单临时计算（不写入数据库）"""
+    summary = db.get(models.UserBalance, user_id)
+    if summary is None:
+        values = _compute_user_balances(db, [user_id]).get(user_id, _empty_balance())
+        summary = models.UserBalance(user_id=user_id, **values)
+    return summary
+
+
+def _apply_balance_delta(db: Session, user_id: int, delta: dict):
+    """在当前事务内把增量累加到用户汇总上"""
+    if user_id is None:
+        return
+    if db.get(models.UserBalance, user_id) is None:
+        db.add(get_user_balance(db, user_id))
+        db.flush()
+    db.query(models.UserBalance).filter(
+        models.UserBalance.user_id == user_id
+    ).update(
+        {
+            getattr(models.UserBalance, field): getattr(models.UserBalance, field)
+            + delta[field]
+            for field in BALANCE_FIELDS
+        },
+        synchronize_session="fetch",
+    )
+
+
+def refresh_user_balance(db: Session, user_id: int):
+    """根据账单表重新计算单个用户的汇总"""
+    values = _compute_user_balances(db, [user_id]).get(user_id, _empty_balance())
+    summary = db.get(models.UserBalance, user_id)
+    if summary is None:
+        summary = models.UserBalance(user_id=user_id)
+        db.add(summary)
+    for field, value in values.items():
+        setattr(summary, field, value)
+    db.commit()
+    return summary
+
+
+def rebuild_user_balances(db: Session):
+    """根据账单表批量重建所有用户的汇总，返回重建的用户数量"""
+    computed = _compute_user_balances(db)
+    user_ids = [row[0] for row in db.query(models.User.id).all()]
+    db.query(models.UserBalance).delete(synchronize_session=False)
+    db.bulk_insert_mappings(
+        models.UserBalance,
+        [
+            {"user_id": user_id, **computed.get(user_id, _empty_balance())}
+            for user_id in user_ids
+        ],
+    )
+    db.commit()
+    return len(user_ids)
+
+
+def verify_user_balances(db: Session):
+    """校验用户汇总与账单表是否一致，返回不一致项列表"""
+    computed = _compute_user_balances(db)
+    stored = {row.user_id: row for row in db.query(models.UserBalance).all()}
+    drift = []
+    for (user_id,) in db.query(models.User.id).all():
+        expected = computed.get(user_id, _empty_balance())
+        summary = stored.get(user_id)
+        for field in BALANCE_FIELDS:
+            actual = getattr(summary, field) if summary is not None else None
+            if actual is None or abs(actual - expected[field]) > BALANCE_TOLERANCE:
+                drift.append(
+                    {
+                        "user_id": user_id,
+                        "field": field,
+                        "expected": expected[field],
+                        "actual": actual,
+                    }
+                )
+    return drift
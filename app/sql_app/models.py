@@ -1,8 +1,9 @@
-from markupsafe import Markup
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float
-from sqlalchemy.orm import relationship
+from markupsafe import Markup, escape
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, DateTime, Float
+from sqlalchemy.orm import relationship, object_session
 
-from .database import Base
+from app.setting import settings
+from .database import Base, SessionLocal
 from datetime import datetime
 
 
@@ -10,19 +11,32 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String)
+    name = Column(String, unique=True, index=True)
     nickname = Column(String)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
 
     bills = relationship("Bill", back_populates="user")  # 添加与Bill的关系
+    balance_summary = relationship(
+        "UserBalance", back_populates="user", uselist=False, cascade="all, delete-orphan"
+    )  # 账单汇总，随用户一起删除
 
     @property
     def bill_info(self):
         """
         在Admin页面使用的用于格式化显示账单信息的方法
+
+        sqladmin 详情页拿到的是已脱离会话的对象，此时用独立的同步会话读取账单，
+        会查询数据库，应在线程中访问（见 UserAdmin.get_detail_value）。
         """
+        session = object_session(self)
+        if session is not None:
+            return self._render_bill_info(session)
+        with SessionLocal() as session:
+            return self._render_bill_info(session)
+
+    def _render_bill_info(self, session):
         table_style = """
         <style>
             .bill-table {
@@ -52,26 +66,57 @@ class User(Base):
         </style>
         """
 
-        table = '<table class="bill-table">'
-        table += "<tr><th>ID</th><th>日期</th><th>摘要</th><th>金额</th><th>已结算</th><th>操作</th></tr>"
-
-        for bill in self.bills:
-            table += "<tr>"
-            table += f"<td>{bill.id}</td>"
-            table += f'<td>{bill.bill_date.strftime("%Y-%m-%d %H:%M:%S")}</td>'
-            table += f"<td>{bill.summary}</td>"
-            table += f"<td>¥{bill.amount:.2f}</td>"
-            table += f'<td>{"是" if bill.handle else "否"}</td>'
-            table += f'<td><a href="/admin/bill/details/{bill.id}" class="action-btn">查看详情</a></td>'
-            table += "</tr>"
-
-        table += "</table>"
-
-        return Markup(table_style + table)
+        from .crud import get_user_balance
+
+        summary = get_user_balance(session, self.id)
+        bills = (
+            session.query(Bill)
+            .filter(Bill.user_id == self.id)
+            .order_by(Bill.bill_date.desc(), Bill.id.desc())
+            .limit(settings.admin_bill_panel_size)
+            .all()
+        )
+
+        totals = (
+            f"<p>收入：¥{summary.total_positive_amount:.2f}&emsp;"
+            f"已结算支出：¥{summary.total_handled_negative_amount:.2f}&emsp;"
+            f"未结算支出：¥{summary.total_unhandled_negative_amount:.2f}&emsp;"
+            f"余额：¥{summary.balance:.2f}</p>"
+            f"<p>共 {summary.bill_count} 条账单，显示最近 {len(bills)} 条</p>"
+        )
+        rows = "".join(
+            "<tr>"
+            f"<td>{bill.id}</td>"
+            f'<td>{bill.bill_date.strftime("%Y-%m-%d %H:%M:%S")}</td>'
+            f"<td>{escape(bill.summary)}</td>"
+            f"<td>¥{bill.amount:.2f}</td>"
+            f'<td>{"是" if bill.handle else "否"}</td>'
+            f'<td><a href="/admin/bill/details/{bill.id}" class="action-btn">查看详情</a></td>'
+            "</tr>"
+            for bill in bills
+        )
+        table = (
+            '<table class="bill-table">'
+            "<tr><th>ID</th><th>日期</th><th>摘要</th><th>金额</th><th>已结算</th><th>操作</th></tr>"
+            f"{rows}</table>"
+        )
+
+        return Markup(table_style + totals + table)
 
 
 class Bill(Base):
     __tablename__ = "bills"
+    __table_args__ = (
+        # 按用户和日期范围查询账单时使用，包含金额和结算状态，
+        # 统计报表只需读取索引而无需回表
+        Index(
+            "ix_bills_user_id_bill_date_amount_handle",
+            "user_id",
+            "bill_date",
+            "amount",
+            "handle",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)  # 主键ID
     bill_date = Column(DateTime, default=datetime.now)  # 创建时间
@@ -115,3 +160,19 @@ class Bill(Base):
         table += "</table>"
 
         return Markup(table_style + table)
+
+
+class UserBalance(Base):
+    """
+    用户账单汇总，随账单的增删改在同一事务内增量维护
+    """
+    __tablename__ = "user_balances"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # 用户ID
+    total_positive_amount = Column(Float, default=0, nullable=False)  # 收入合计
+    total_handled_negative_amount = Column(Float, default=0, nullable=False)  # 已结算支出合计
+    total_unhandled_negative_amount = Column(Float, default=0, nullable=False)  # 未结算支出合计
+    balance = Column(Float, default=0, nullable=False)  # 余额
+    bill_count = Column(Integer, default=0, nullable=False)  # 账单数量
+
+    user = relationship("User", back_populates="balance_summary")
@@ -31,12 +31,45 @@ class Bill(BillBase):
             values.bill_date = values.bill_date.strftime("%Y-%m-%d %H:%M:%S")
         return values
 
+class BillImportError(BaseModel):
+    line: int  # 出错的行号
+    error: str
+
+
+class BillImportResult(BaseModel):
+    imported: int  # 成功导入的数量
+    failed: int  # 校验失败的数量
+    errors: List[BillImportError] = []
+    errors_truncated: bool = False  # 错误过多时只保留前若干条明细
+
+class ReportPeriod(BaseModel):
+    period: str  # 月份（YYYY-MM）或日期（YYYY-MM-DD）
+    income: float  # 收入
+    handled_expense: float  # 已结算支出，为负数
+    unhandled_expense: float  # 未结算支出，为负数
+    net: float  # 净额
+    bill_count: int
+
+
+class Report(BaseModel):
+    year: int
+    granularity: str
+    periods: List[ReportPeriod] = []  # 只包含有账单的月份或日期
+
 class UserBase(BaseModel):
     name: str
     nickname: str
     email: str
     is_active: bool
 
+class CurrentUser(UserBase):
+    """已认证用户的快照，会在多个请求间共享，因此不可修改"""
+    id: int
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
 class UserCreate(UserBase):
     hashed_password: str
 
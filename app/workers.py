@@ -0,0 +1,100 @@
+"""
+执行CPU密集型任务的工作池
+
+异步接口中直接执行 bcrypt、PDF 渲染之类的同步计算会阻塞事件循环，
+这里把它们交给线程池或进程池执行，并用信号量限制同时提交的任务数，
+超出上限的请求在事件循环中排队等待，不会占用额外的线程或进程。
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.setting import settings
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = None,
+        max_concurrency: int = None,
+        initializer=None,
+        initargs=(),
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"不支持的工作池类型: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._loop = None
+        self._semaphore = None
+
+    @property
+    def executor(self):
+        """第一次使用时才创建线程池或进程池"""
+        if self._executor is None:
+            if self.kind == "process":
+                # 服务进程中有数据库等后台线程，使用 spawn 启动子进程避免 fork 带来的死锁
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                    initargs=self.initargs,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=self.initializer,
+                    initargs=self.initargs,
+                )
+        return self._executor
+
+    @property
+    def size(self) -> int:
+        """工作线程或进程数"""
+        return self.executor._max_workers
+
+    def _get_semaphore(self):
+        # 信号量绑定在创建它的事件循环上，事件循环变化时重新创建
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(
+                self.max_concurrency or self.size
+            )
+        return self._semaphore
+
+    def submit(self, func, *args):
+        """直接提交任务，返回 concurrent.futures.Future，不受并发上限限制"""
+        return self.executor.submit(func, *args)
+
+    async def run(self, func, *args):
+        """在工作池中执行 func(*args) 并等待结果，同时执行的任务数不超过并发上限"""
+        async with self._get_semaphore():
+            return await asyncio.wrap_future(self.executor.submit(func, *args))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 密码哈希与校验使用的工作池
+password_pool = WorkerPool(
+    kind=settings.password_hash_executor,
+    max_workers=settings.password_hash_workers,
+    max_concurrency=settings.password_hash_max_concurrency,
+)
+
+# 文档渲染、PDF 处理等CPU密集型任务使用的进程池
+cpu_pool = WorkerPool(
+    kind="process",
+    max_workers=settings.cpu_pool_workers,
+    max_concurrency=settings.cpu_pool_max_concurrency,
+)
+
+# PDF 水印后台任务使用的进程池，每个任务占用一个进程，超出的任务在进程池中排队
+job_pool = WorkerPool(kind="process", max_workers=settings.pdfmarks_max_jobs)
@@ -0,0 +1,117 @@
+"""
+登录突发期间其他接口延迟的基准测试
+
+在同一个事件循环中并发发起一批登录请求，同时持续请求一个与登录无关的接口，
+分别统计 bcrypt 在事件循环中直接执行（旧实现）和交给 password_pool 执行时，
+无关接口的 p50/p99 延迟。
+
+用法:
+    python benchmarks/bench_login_burst.py --logins 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from fastapi.security import OAuth2PasswordRequestForm  # noqa: E402
+
+from app.dependencies import get_read_db  # noqa: E402
+from app.routers.auth import router as auth_router  # noqa: E402
+from app.sql_app import crud, models, schemas  # noqa: E402
+from app.sql_app.database import SessionLocal, engine  # noqa: E402
+
+USERNAME, PASSWORD = "bench", "bench-password"
+PROBE_INTERVAL = 0.01
+
+
+def build_app():
+    app = FastAPI()
+    app.include_router(auth_router)
+
+    @app.post("/token_inline")
+    async def login_inline(
+        form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_read_db)
+    ):
+        # 旧实现：在事件循环中直接执行包含 bcrypt 校验的同步认证
+        result = await db.run_sync(
+            crud.authenticate_user, form_data.username, form_data.password
+        )
+        return {"status": result["status"]}
+
+    @app.get("/ping")
+    async def ping():
+        return {"pong": True}
+
+    return app
+
+
+async def run(client, login_path, logins):
+    form = {"username": USERNAME, "password": PASSWORD}
+    latencies = []
+    done = asyncio.Event()
+
+    async def probe():
+        # 登录请求全部完成前按固定间隔请求无关接口，延迟从计划发送时间算起，
+        # 这样事件循环被阻塞而推迟发送的时间也会计入延迟
+        scheduled = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(max(0, scheduled - time.perf_counter()))
+            await client.get("/ping")
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+            scheduled += PROBE_INTERVAL
+
+    async def burst():
+        try:
+            return await asyncio.gather(
+                *(client.post(login_path, data=form) for _ in range(logins))
+            )
+        finally:
+            done.set()
+
+    begin = time.perf_counter()
+    _, responses = await asyncio.gather(probe(), burst())
+    elapsed = time.perf_counter() - begin
+    assert all(response.status_code == 200 for response in responses)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return statistics.median(latencies), p99, max(latencies), elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=20)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    crud.create_user(
+        db,
+        schemas.UserCreate(
+            name=USERNAME,
+            nickname=USERNAME,
+            email="bench@example.com",
+            is_active=True,
+            hashed_password=PASSWORD,
+        ),
+    )
+    db.close()
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'模式':<12} {'p50(ms)':>10} {'p99(ms)':>10} {'max(ms)':>10} {'总耗时(s)':>10}")
+        for name, path in (("事件循环内", "/token_inline"), ("工作池", "/token")):
+            p50, p99, worst, elapsed = await run(client, path, args.logins)
+            print(f"{name:<12} {p50:>10.2f} {p99:>10.2f} {worst:>10.2f} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+会议表格解析的基准测试
+
+对比旧实现（BeautifulSoup html.parser + 每行 eval 模板）与新实现
+（lxml 提取单元格 + 预编译模板）处理多行会议表格的耗时，并校验两者输出一致。
+
+用法:
+    python benchmarks/bench_meeting.py --rows 1000 5000 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from app.handler.meeting import MeetingTemplate, parse_rows  # noqa: E402
+
+TEMPLATE = "{time}&emsp;&emsp;&emsp;{name}<br/>会议负责人：<br/>会议分类：<br/>关注内容：<br/><br/>{url}<br/>"
+
+
+def build_table(rows):
+    body = "".join(
+        f"<tr><td> {9 + i % 8}:00 - {10 + i % 8}:00 </td>"
+        f"<td>第{i}次 项目 例会【线上】</td>"
+        f'<td><a href="https://meeting.example.com/{i}">入会链接</a></td></tr>'
+        for i in range(rows)
+    )
+    return f"<table><tr><th>时间</th><th>会议</th><th>链接</th></tr>{body}</table>"
+
+
+def old_meeting(data, models):
+    """旧实现，逻辑与改造前的 /meeting/ 相同"""
+    soup = BeautifulSoup(data, "html.parser")
+    table = soup.find("table")
+    temple = []
+    for row in table.find_all("tr"):
+        cell = row.find_all("td")
+        try:
+            time = (  # noqa: F841
+                (cell[0].text).replace(" ", "").replace("\n", "").replace(":", "：").split("-")[0]
+            )
+        except Exception:
+            time = ""  # noqa: F841
+        try:
+            name = (cell[1].text).replace(" ", "").replace("\n", "").split("【")[0]  # noqa: F841
+        except Exception:
+            name = ""  # noqa: F841
+        try:
+            url = cell[2].find("a").get("href")  # noqa: F841
+        except Exception:
+            url = ""  # noqa: F841
+        temple.append(eval(f'f"{models}"'))
+    return temple
+
+
+def new_meeting(data, template):
+    return [template.format(**row) for row in parse_rows(data)]
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - begin)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    template = MeetingTemplate(TEMPLATE)
+    print(f"{'行数':>8} {'旧实现(ms)':>12} {'新实现(ms)':>12} {'加速比':>8}")
+    for rows in args.rows:
+        data = build_table(rows)
+        old_ms, old_result = timed(lambda: old_meeting(data, TEMPLATE), args.repeat)
+        new_ms, new_result = timed(lambda: new_meeting(data, template), args.repeat)
+        assert old_result == new_result, "新旧实现的输出不一致"
+        print(f"{rows:>8} {old_ms:>12.1f} {new_ms:>12.1f} {old_ms / new_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+文件合并接口的吞吐量基准测试
+
+在本地启动桩合并服务（模拟固定的合并耗时），并发发起一批 /mergefiles/ 请求，
+对比旧实现（整个文件读入内存后写盘，在事件循环中同步调用 requests.post）
+和新实现（分块写盘，共享连接池的 httpx.AsyncClient）的总耗时、吞吐量和延迟。
+不需要外部合并服务。
+
+用法:
+    python benchmarks/bench_mergefiles.py --requests 20 --delay 0.2 --size 1048576
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import requests  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile  # noqa: E402
+
+from app.handler.merge import RemoteMergeBackend, create_stub_app  # noqa: E402
+from app.routers import others  # noqa: E402
+
+
+def start_stub(delay: float) -> str:
+    """在后台线程中启动桩合并服务，返回它的地址"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(create_stub_app(delay), port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/Merge"
+
+
+def old_app(url: str, workdir: Path) -> FastAPI:
+    """旧实现，逻辑与改造前的 /mergefiles/ 相同"""
+    app = FastAPI()
+
+    @app.post("/mergefiles/")
+    async def mergefiles(files: List[UploadFile] = File(...), fileOrder: str = Form(...)):
+        json.loads(fileOrder)
+        temp_dir = str(uuid.uuid4())
+        temp_path = workdir.joinpath(temp_dir)
+        os.makedirs(temp_path, exist_ok=True)
+        saved_files = []
+        for file in files:
+            file_path = os.path.join(temp_path, file.filename)
+            with open(file_path, "wb") as buffer:
+                buffer.write(await file.read())
+            saved_files.append(str(file_path))
+        data = {
+            "pathList": saved_files,
+            "additionalString": str(workdir.joinpath(f"output/{temp_dir}.pptx")),
+        }
+        response = requests.post(url, json=data)
+        shutil.rmtree(temp_path)
+        if response.status_code == 200:
+            return response.json()
+        raise HTTPException(status_code=400, detail="合并失败")
+
+    return app
+
+
+def new_app(url: str) -> FastAPI:
+    app = FastAPI()
+    app.include_router(others.router)
+    backend = RemoteMergeBackend(url)
+    app.dependency_overrides[others.get_merge_backend] = lambda: backend
+    return app
+
+
+async def run(app: FastAPI, requests_count: int, payload: bytes, files_per_request: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one(index):
+            files = [
+                ("files", (f"{index}-{n}.bin", payload, "application/octet-stream"))
+                for n in range(files_per_request)
+            ]
+            begin = time.perf_counter()
+            response = await client.post("/mergefiles/", files=files, data={"fileOrder": "[]"})
+            response.raise_for_status()
+            Path(response.json()["path"]).unlink(missing_ok=True)
+            return time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(requests_count)))
+        return time.perf_counter() - begin, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--files", type=int, default=3, help="每个请求上传的文件数")
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="每个文件的字节数")
+    parser.add_argument("--delay", type=float, default=0.2, help="桩合并服务的合并耗时（秒）")
+    args = parser.parse_args()
+
+    url = start_stub(args.delay)
+    payload = os.urandom(args.size)
+    print(
+        f"{args.requests} 个并发请求，每个 {args.files} 个 {args.size / 1024:.0f} KiB 的文件，"
+        f"合并耗时 {args.delay * 1000:.0f} ms"
+    )
+    print(f"{'实现':<8} {'总耗时(s)':>10} {'请求/秒':>8} {'p50(ms)':>9} {'p99(ms)':>9}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for label, app in (("旧实现", old_app(url, Path(workdir))), ("新实现", new_app(url))):
+            elapsed, latencies = asyncio.run(run(app, args.requests, payload, args.files))
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(
+                f"{label:<8} {elapsed:>10.2f} {args.requests / elapsed:>8.1f}"
+                f" {statistics.median(latencies) * 1000:>9.0f} {p99 * 1000:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+按月查询账单的基准测试
+
+对比旧的 extract("month") 写法与新的 [当月第一天, 下月第一天) 日期范围写法，
+输出 SQLite 的查询计划，并在账单表逐步增大时记录两种写法的查询耗时。
+
+用法:
+    python benchmarks/bench_month_bills.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, extract, insert, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.sql_app import crud, models  # noqa: E402
+
+USERS = 100
+TARGET_USER = 1
+YEAR, MONTH = 2024, 6
+
+
+def old_query(db, user_id, month):
+    return (
+        db.query(models.Bill)
+        .filter(
+            models.Bill.user_id == user_id,
+            extract("month", models.Bill.bill_date) == month,
+        )
+        .all()
+    )
+
+
+def fill(engine, start, stop):
+    """插入编号为 [start, stop) 的账单，日期分布在 2020-2024 年"""
+    base = datetime(2020, 1, 1)
+    rows = []
+    with engine.begin() as conn:
+        for i in range(start, stop):
+            rows.append(
+                {
+                    "bill_date": base + timedelta(minutes=random.randrange(5 * 365 * 24 * 60)),
+                    "summary": f"bill {i}",
+                    "amount": random.uniform(-500, 500),
+                    "handle": random.random() < 0.5,
+                    "user_id": random.randint(1, USERS),
+                }
+            )
+            if len(rows) == 10000:
+                conn.execute(insert(models.Bill), rows)
+                rows = []
+        if rows:
+            conn.execute(insert(models.Bill), rows)
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - begin)
+    return best * 1000
+
+
+def explain(db, query):
+    statement = query.statement.compile(
+        dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}
+    )
+    rows = db.execute(text(f"EXPLAIN QUERY PLAN {statement}")).all()
+    return "; ".join(row[-1] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        start, end = crud.month_range(YEAR, MONTH)
+
+        new_plan = explain(
+            db,
+            db.query(models.Bill).filter(
+                models.Bill.user_id == TARGET_USER,
+                models.Bill.bill_date >= start,
+                models.Bill.bill_date < end,
+            ),
+        )
+        old_plan = explain(
+            db,
+            db.query(models.Bill).filter(
+                models.Bill.user_id == TARGET_USER,
+                extract("month", models.Bill.bill_date) == MONTH,
+            ),
+        )
+        print(f"旧写法查询计划: {old_plan}")
+        print(f"新写法查询计划: {new_plan}")
+        print()
+        print(f"{'账单数':>10} {'旧写法(ms)':>12} {'新写法(ms)':>12} {'旧行数':>8} {'新行数':>8}")
+
+        filled = 0
+        for size in sorted(args.sizes):
+            fill(engine, filled, size)
+            filled = size
+            db.execute(text("ANALYZE"))
+            old_rows = len(old_query(db, TARGET_USER, MONTH))
+            new_rows = len(crud.get_user_bills(db, TARGET_USER, MONTH, YEAR))
+            old_ms = timed(lambda: old_query(db, TARGET_USER, MONTH), args.repeat)
+            new_ms = timed(
+                lambda: crud.get_user_bills(db, TARGET_USER, MONTH, YEAR), args.repeat
+            )
+            print(f"{size:>10} {old_ms:>12.2f} {new_ms:>12.2f} {old_rows:>8} {new_rows:>8}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
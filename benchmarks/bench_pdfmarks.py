@@ -0,0 +1,140 @@
+"""
+PDF 批量水印的基准测试
+
+生成一个多页的测试PDF，为一组接收人添加水印，对比三种实现的耗时：
+- 旧实现：每个接收人把水印写入磁盘、重新解析源文件、输出写入磁盘，最后打包目录
+- 单进程：源文件只解析一次，水印和输出都在内存中
+- 进程池：接收人分批交给进程池并行处理
+
+用法:
+    python benchmarks/bench_pdfmarks.py --recipients 50 --pages 100 --workers 4
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfReader, PdfWriter  # noqa: E402
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+
+from app.handler.pdfmarks import (  # noqa: E402
+    create_watermark,
+    pdf_marks,
+    split_batches,
+    time_mark,
+    watermark_batch,
+    write_zip,
+)
+from app.workers import WorkerPool  # noqa: E402
+
+
+def build_pdf(pages: int) -> bytes:
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(pages):
+        c.setFont("Helvetica", 11)
+        for line in range(50):
+            c.drawString(60, 780 - line * 15, f"Page {page + 1} line {line + 1} " + "lorem ipsum " * 6)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def old_pdf_marks(source: bytes, names, workdir):
+    """旧实现，逻辑与改造前的 pdf_marks 相同"""
+    original = os.path.join(workdir, "original.pdf")
+    output_dir = os.path.join(workdir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(original, "wb") as f:
+        f.write(source)
+    stamp = time_mark()
+    for name in names:
+        mark_file = os.path.join(workdir, "mark.pdf")
+        with open(mark_file, "wb") as f:
+            f.write(create_watermark(name + " " + stamp))
+        pdf_output = PdfWriter()
+        with open(original, "rb") as input_stream:
+            pdf_input = PdfReader(input_stream, strict=False)
+            pdf_watermark = PdfReader(open(mark_file, "rb"), strict=False)
+            for i in range(len(pdf_input.pages)):
+                page = pdf_input.pages[i]
+                page.merge_page(pdf_watermark.pages[0])
+                page.compress_content_streams()
+                pdf_output.add_page(page)
+            with open(os.path.join(output_dir, f"【{name}】test.pdf"), "wb") as f:
+                pdf_output.write(f)
+    zip_name = os.path.join(workdir, "old.zip")
+    with zipfile.ZipFile(zip_name, "w") as zipf:
+        for file in os.listdir(output_dir):
+            zipf.write(os.path.join(output_dir, file), file)
+    return zip_name
+
+
+async def pooled_pdf_marks(pool, source: bytes, names, zip_path):
+    stamp = time_mark()
+    results = await asyncio.gather(
+        *(
+            pool.run(watermark_batch, source, batch, stamp)
+            for batch in split_batches(names, pool.size)
+        )
+    )
+    return write_zip(zip_path, "test.pdf", (item for batch in results for item in batch))
+
+
+def timed(func):
+    begin = time.perf_counter()
+    path = func()
+    elapsed = time.perf_counter() - begin
+    with zipfile.ZipFile(path) as zipf:
+        count = len(zipf.namelist())
+    return elapsed, os.path.getsize(path), count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--skip-old", action="store_true", help="不运行旧实现")
+    args = parser.parse_args()
+
+    source = build_pdf(args.pages)
+    names = [f"接收人{i:03d}" for i in range(args.recipients)]
+    print(f"{args.recipients} 个接收人 x {args.pages} 页，源文件 {len(source) / 1024:.0f} KiB")
+
+    pool = WorkerPool(kind="process", max_workers=args.workers)
+    pool.submit(time_mark).result()  # 预先启动工作进程，不计入耗时
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = []
+        if not args.skip_old:
+            cases.append(("旧实现", lambda: old_pdf_marks(source, names, workdir)))
+        cases.append(
+            ("单进程", lambda: pdf_marks(source, "test.pdf", ",".join(names), os.path.join(workdir, "single.zip")))
+        )
+        cases.append(
+            (
+                f"进程池({pool.size})",
+                lambda: asyncio.run(
+                    pooled_pdf_marks(pool, source, names, os.path.join(workdir, "pool.zip"))
+                ),
+            )
+        )
+        print(f"{'实现':<10} {'耗时(s)':>10} {'每人(ms)':>10} {'压缩包(MiB)':>12} {'文件数':>6}")
+        for label, func in cases:
+            elapsed, size, count = timed(func)
+            print(
+                f"{label:<10} {elapsed:>10.2f} {elapsed / args.recipients * 1000:>10.1f}"
+                f" {size / 1024 / 1024:>12.2f} {count:>6}"
+            )
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+大文件PDF水印的内存基准测试
+
+生成每页一张不同灰度图片的“扫描件”PDF，分别用普通模式（PdfWriter 在内存中生成整个文件）
+和低内存模式（增量更新，结果直接写入文件）为一个接收人添加水印，
+记录不同页数下工作进程的峰值 RSS 和每秒处理的页数。每次测量在独立的子进程中进行。
+
+用法:
+    python benchmarks/bench_pdfmarks_memory.py --pages 100 250 500 1000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_scanned_pdf(path, pages: int, width: int, height: int):
+    """逐页写入，生成器本身只占用一页图片的内存"""
+    offsets = {}
+    with open(path, "wb") as f:
+
+        def obj(number, body: bytes, stream: bytes = None):
+            offsets[number] = f.tell()
+            f.write(b"%d 0 obj\n" % number + body)
+            if stream is not None:
+                f.write(b"\nstream\n" + stream + b"\nendstream")
+            f.write(b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        kids = b" ".join(b"%d 0 R" % (3 + i * 3) for i in range(pages))
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages))
+        content = b"q %d 0 0 %d 0 0 cm /Im0 Do Q" % (width, height)
+        for i in range(pages):
+            page, contents, image = 3 + i * 3, 4 + i * 3, 5 + i * 3
+            obj(
+                page,
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R"
+                b" /Resources << /XObject << /Im0 %d 0 R >> >> >>" % (width, height, contents, image),
+            )
+            obj(contents, b"<< /Length %d >>" % len(content), content)
+            pixels = os.urandom(width * height)
+            obj(
+                image,
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray"
+                b" /BitsPerComponent 8 /Length %d >>" % (width, height, len(pixels)),
+                pixels,
+            )
+        size = 3 + pages * 3
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for number in range(1, size):
+            f.write(b"%010d 00000 n \n" % offsets[number])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+
+
+def child(mode: str, source_path: str, output_path: str):
+    """在子进程中执行一次水印，输出峰值 RSS 和耗时"""
+    from PyPDF2 import PdfReader
+
+    from app.handler.pdfmarks import add_watermark, add_watermark_low_memory, register_font
+
+    register_font()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    begin = time.perf_counter()
+    with open(source_path, "rb") as source, open(output_path, "wb") as output:
+        pdf_input = PdfReader(source, strict=False)
+        pages = len(pdf_input.pages)
+        if mode == "low_memory":
+            add_watermark_low_memory(pdf_input, source, "接收人 2024-01-01", output)
+        else:
+            output.write(add_watermark(pdf_input, "接收人 2024-01-01"))
+    elapsed = time.perf_counter() - begin
+    print(
+        json.dumps(
+            {
+                "pages": pages,
+                "elapsed": elapsed,
+                "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "baseline_rss_kib": baseline,
+                "output_bytes": os.path.getsize(output_path),
+            }
+        )
+    )
+
+
+def measure(mode: str, source_path: str, workdir: str) -> dict:
+    output_path = os.path.join(workdir, f"out-{mode}.pdf")
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, source_path, output_path],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    os.remove(output_path)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 250, 500, 1000])
+    parser.add_argument("--width", type=int, default=400, help="每页图片的宽度（像素）")
+    parser.add_argument("--height", type=int, default=500, help="每页图片的高度（像素）")
+    parser.add_argument("--modes", nargs="+", default=["normal", "low_memory"])
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "SOURCE", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    print(f"{'页数':>6} {'源文件(MiB)':>12} {'模式':<12} {'峰值RSS(MiB)':>13} {'增量RSS(MiB)':>13} {'页/秒':>8} {'输出(MiB)':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for pages in args.pages:
+            source_path = os.path.join(workdir, f"scan-{pages}.pdf")
+            build_scanned_pdf(source_path, pages, args.width, args.height)
+            source_mib = os.path.getsize(source_path) / 1024 / 1024
+            for mode in args.modes:
+                result = measure(mode, source_path, workdir)
+                print(
+                    f"{pages:>6} {source_mib:>12.1f} {mode:<12}"
+                    f" {result['peak_rss_kib'] / 1024:>13.1f}"
+                    f" {(result['peak_rss_kib'] - result['baseline_rss_kib']) / 1024:>13.1f}"
+                    f" {pages / result['elapsed']:>8.0f}"
+                    f" {result['output_bytes'] / 1024 / 1024:>10.1f}"
+                )
+            os.remove(source_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import logging
 from app.logger import main_logger
 
 from sqladmin import Admin
+from sqlalchemy import inspect, text
 from passlib.context import CryptContext
 
 from app.sql_app import models, AdminSchemas
@@ -13,12 +14,38 @@ from app.sql_app.database import engine
 from app.routers.auth import router as auth_router
 from app.routers.user import router as user_router
 from app.routers.bill import router as bill_router
-from app.routers.others import router as others_router
+from app.routers.others import merge_backend, router as others_router
 
 from app.setting import settings
+from app.workers import cpu_pool, job_pool, password_pool
 
 
 models.Base.metadata.create_all(bind=engine)
+# create_all 不会为已存在的表补建新增的索引
+for table in models.Base.metadata.sorted_tables:
+    for index in table.indexes:
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except Exception as e:
+            # 例如旧数据中存在重名用户时无法建立唯一索引，需要先处理数据
+            main_logger.warning(f"Failed to create index {index.name}: {e}")
+
+# 已被上面的新索引覆盖的旧索引，保留会让每次写入多维护一份重复的索引
+SUPERSEDED_INDEXES = {
+    # 被 ix_bills_user_id_bill_date_amount_handle 取代
+    "ix_bills_user_id_bill_date": "ix_bills_user_id_bill_date_amount_handle",
+}
+existing_indexes = {
+    index["name"]
+    for table in models.Base.metadata.sorted_tables
+    for index in inspect(engine).get_indexes(table.name)
+}
+with engine.begin() as connection:
+    for old, new in SUPERSEDED_INDEXES.items():
+        # 只有新索引已经建好时才删除旧索引
+        if old in existing_indexes and new in existing_indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {old}"))
+            main_logger.info(f"Dropped superseded index {old}")
 
 app = FastAPI(
     title="FianceApp",
@@ -57,6 +84,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # 允许所有方法
     allow_headers=["*"],  # 允许所有头
+    expose_headers=["X-Next-Cursor"],  # 允许前端读取分页游标
 )
 
 # 设置 Admin
@@ -75,6 +103,12 @@ app.include_router(user_router)
 app.include_router(bill_router)
 app.include_router(others_router)
 
+# 关闭时释放工作池
+app.add_event_handler("shutdown", password_pool.shutdown)
+app.add_event_handler("shutdown", cpu_pool.shutdown)
+app.add_event_handler("shutdown", job_pool.shutdown)
+app.add_event_handler("shutdown", merge_backend.aclose)
+
 # 配置Uvicorn的日志
 uvicorn_logger = logging.getLogger("uvicorn")
 uvicorn_logger.handlers = main_logger.handlers
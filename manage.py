@@ -0,0 +1,57 @@
+"""
+命令行管理工具
+
+用法:
+    python manage.py rebuild-balances   根据账单表重建所有用户的账单汇总
+    python manage.py verify-balances    校验用户账单汇总与账单表是否一致
+"""
+import argparse
+import sys
+
+from app.logger import db_logger
+from app.sql_app import crud, models
+from app.sql_app.database import SessionLocal, engine
+
+
+def rebuild_balances(db):
+    count = crud.rebuild_user_balances(db)
+    db_logger.info(f"Rebuilt balance summaries for {count} users")
+    print(f"已重建 {count} 个用户的账单汇总")
+    return 0
+
+
+def verify_balances(db):
+    drift = crud.verify_user_balances(db)
+    if not drift:
+        print("账单汇总与账单表一致")
+        return 0
+    for item in drift:
+        print(
+            f"用户 {item['user_id']} 的 {item['field']} 不一致: "
+            f"应为 {item['expected']}，实际为 {item['actual']}"
+        )
+    db_logger.warning(f"Found {len(drift)} drifted balance fields")
+    return 1
+
+
+COMMANDS = {
+    "rebuild-balances": rebuild_balances,
+    "verify-balances": verify_balances,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FianceApp 管理工具")
+    parser.add_argument("command", choices=COMMANDS.keys())
+    args = parser.parse_args(argv)
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        return COMMANDS[args.command](db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())